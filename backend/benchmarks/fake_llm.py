@@ -0,0 +1,45 @@
+import asyncio
+import json
+import re
+
+from langchain_core.messages import AIMessage
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import RunnableLambda
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+PHONE_PATTERN = re.compile(r"\+?\d[\d\s\-\(\)]{6,}\d")
+
+def _extract_leads(text: str) -> str:
+    body = text.split("Text:", 1)[-1].split("Format Instructions:", 1)[0]
+    leads = []
+    for line in body.splitlines():
+        email = EMAIL_PATTERN.search(line)
+        if not email:
+            continue
+        phone = PHONE_PATTERN.search(line[email.end():])
+        name = line[:email.start()].strip(" ,;\t") or "Unknown Contact"
+        leads.append({
+            "name": name,
+            "email": email.group(0),
+            "phone": phone.group(0).strip() if phone else "N/A",
+            "status": "New",
+            "source": "Document",
+        })
+    return json.dumps({"leads": leads})
+
+def _respond(prompt: PromptValue) -> AIMessage:
+    text = prompt.to_string()
+    if "Format Instructions:" in text:
+        return AIMessage(content=_extract_leads(text))
+    name = re.search(r"Lead Name: (.*)", text)
+    return AIMessage(content=f"Schedule a follow-up call with {name.group(1) if name else 'the lead'}.")
+
+def build_fake_llm(latency_ms: float = 0.0) -> RunnableLambda:
+    # Deterministic stand-in for the chat model: it parses contact lines the
+    # way a well-behaved LLM would and can simulate network/model latency.
+    async def respond(prompt: PromptValue) -> AIMessage:
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        return _respond(prompt)
+
+    return RunnableLambda(_respond, afunc=respond, name="FakeLeadModel")
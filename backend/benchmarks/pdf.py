@@ -0,0 +1,63 @@
+from typing import List
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def build_pdf(pages: List[List[str]]) -> bytes:
+    # Minimal single-font PDF writer so benchmarks need no extra dependency.
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{4 + 2 * index} 0 R" for index in range(len(pages))), len(pages)
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for index, lines in enumerate(pages):
+        stream = "BT /F1 9 Tf 11 TL 36 806 Td " + " ".join(f"({_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * index} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode("latin-1")
+    output += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode("latin-1")
+    return bytes(output)
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "ba"]
+
+def _name_part(number: int) -> str:
+    # Digits spelled as syllables keep generated names unique yet alphabetic,
+    # so they read as names to the local pre-extraction pass.
+    return "".join(SYLLABLES[int(digit)] for digit in str(number)).capitalize()
+
+def contact_lines(number: int, layout: str) -> List[str]:
+    name = f"{_name_part(number)} {_name_part(number % 997)}"
+    email = f"contact{number}@bench.example"
+    phone = f"+1 555 {number % 10000000:07d}"
+    if layout == "table":
+        return [f"{name}, {email}, {phone}"]
+    # Free-form records spread each person over labelled lines, which the
+    # local pass leaves to the LLM.
+    return [f"Contact: {name}", f"Reach at {email} or call {phone} (office)", ""]
+
+def build_contact_sheet(pages: int, rows_per_page: int = 60, offset: int = 0, layout: str = "table") -> bytes:
+    sheet = []
+    for page in range(pages):
+        lines: List[str] = []
+        for row in range(rows_per_page):
+            lines.extend(contact_lines(offset + page * rows_per_page + row, layout))
+        sheet.append(lines)
+    return build_pdf(sheet)
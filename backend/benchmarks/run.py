@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+STATUSES = ["New", "Contacted", "Qualified", "Proposal", "Negotiation", "Closed Won", "Closed Lost"]
+SOURCES = ["Manual", "Document", "Web Form", "Email", "Phone", "Social Media", "Referral"]
+
+# Lower is better for latencies, higher is better for throughput.
+COMPARED_METRICS = {"p50_ms": -1, "p99_ms": -1, "ops_per_sec": 1}
+
+def seed_leads(database_file: str, count: int, batch_size: int = 50000) -> None:
+    conn = sqlite3.connect(database_file)
+    rng = random.Random(42)
+    try:
+        for start in range(0, count, batch_size):
+            rows = [
+                (
+                    f"Seed Lead {number}",
+                    f"seed{number}@bench.example",
+                    f"+1 555 {number % 10000000:07d}",
+                    rng.choice(STATUSES),
+                    rng.choice(SOURCES),
+                )
+                for number in range(start, min(start + batch_size, count))
+            ]
+            conn.executemany(
+                "INSERT INTO leads (name, email, phone, status, source) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            conn.commit()
+    finally:
+        conn.close()
+
+def summarize(latencies: List[float], wall_seconds: float) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    p99_index = max(0, int(round(0.99 * len(ordered))) - 1)
+    return {
+        "count": len(ordered),
+        "wall_seconds": round(wall_seconds, 4),
+        "ops_per_sec": round(len(ordered) / wall_seconds, 2) if wall_seconds else 0.0,
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p99_ms": round(ordered[p99_index] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+async def measure(
+    name: str,
+    operation: Callable[[int], Any],
+    iterations: int,
+    concurrency: int,
+    results: Dict[str, Dict[str, float]],
+) -> None:
+    latencies: List[float] = []
+    counter = iter(range(iterations))
+
+    async def worker() -> None:
+        for index in counter:
+            started = time.perf_counter()
+            await operation(index)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    results[name] = summarize(latencies, time.perf_counter() - started)
+    print(f"{name:<28} {results[name]['ops_per_sec']:>10.1f} ops/s  "
+          f"p50 {results[name]['p50_ms']:>8.2f} ms  p99 {results[name]['p99_ms']:>8.2f} ms")
+
+def expect(response, status_code: int) -> None:
+    if response.status_code != status_code:
+        raise RuntimeError(
+            f"{response.request.method} {response.request.url} returned {response.status_code}: {response.text[:200]}"
+        )
+
+def install_fake_llm(args: argparse.Namespace) -> None:
+    # The app's lifespan closes the shared runtime on shutdown, so each phase
+    # installs its own deterministic stand-in before it starts.
+    from benchmarks.fake_llm import build_fake_llm
+    from services.llm_runtime import LLMRuntime, set_llm_runtime
+
+    set_llm_runtime(LLMRuntime(build_fake_llm(args.llm_latency_ms), model_name="fake-lead-model"))
+
+async def run_api_benchmarks(args: argparse.Namespace, results: Dict[str, Dict[str, float]]) -> None:
+    import httpx
+    from main import app
+
+    install_fake_llm(args)
+
+    rng = random.Random(7)
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            created_ids: List[int] = []
+
+            async def create(index: int) -> None:
+                response = await client.post("/leads/", json={
+                    "name": f"Bench Lead {index}",
+                    "email": f"bench{index}@create.example",
+                    # Distinct contacts, so the duplicate check lets every create through.
+                    "phone": f"+1 556 {index:07d}",
+                    "source": "Manual",
+                })
+                expect(response, 201)
+                created_ids.append(response.json()["id"])
+
+            async def read(index: int) -> None:
+                expect(await client.get(f"/leads/{rng.randint(1, args.leads)}"), 200)
+
+            async def list_first_page(index: int) -> None:
+                expect(await client.get("/leads/", params={"limit": 100}), 200)
+
+            async def list_large_page(index: int) -> None:
+                expect(await client.get("/leads/", params={"limit": 1000}), 200)
+
+            async def list_filtered(index: int) -> None:
+                expect(await client.get("/leads/", params={
+                    "limit": 100, "status_filter": rng.choice(STATUSES), "source_filter": rng.choice(SOURCES)
+                }), 200)
+
+            async def list_deep_offset(index: int) -> None:
+                offset = max(0, args.leads - 200 - rng.randint(0, 100))
+                expect(await client.get("/leads/", params={"limit": 100, "offset": offset}), 200)
+
+            async def list_deep_cursor(index: int) -> None:
+                expect(await client.get("/leads/", params={"limit": 100, "before_id": rng.randint(101, 300)}), 200)
+
+            async def update(index: int) -> None:
+                lead_id = created_ids[index % len(created_ids)]
+                expect(await client.put(f"/leads/{lead_id}", json={
+                    "name": f"Bench Lead {index}",
+                    "email": f"bench{lead_id}@update.example",
+                    "phone": "+1 555 0199",
+                    "status": rng.choice(STATUSES),
+                    "source": "Manual",
+                }), 200)
+
+            async def delete(index: int) -> None:
+                expect(await client.delete(f"/leads/{created_ids[index]}"), 204)
+
+            iterations, concurrency = args.iterations, args.concurrency
+            await measure("leads.create", create, iterations, concurrency, results)
+            await measure("leads.read", read, iterations, concurrency, results)
+            await measure("leads.list", list_first_page, iterations, concurrency, results)
+            await measure("leads.list_1000", list_large_page, iterations, concurrency, results)
+            await measure("leads.list_filtered", list_filtered, iterations, concurrency, results)
+            await measure("leads.list_deep_offset", list_deep_offset, iterations, concurrency, results)
+            await measure("leads.list_deep_cursor", list_deep_cursor, iterations, concurrency, results)
+            await measure("leads.update", update, iterations, concurrency, results)
+            await measure("leads.delete", delete, len(created_ids), concurrency, results)
+
+async def run_document_benchmarks(args: argparse.Namespace, results: Dict[str, Dict[str, float]]) -> None:
+    from benchmarks.pdf import build_contact_sheet
+    from services.document_processing_service import process_document_for_lead
+    from services.text_extraction_service import shutdown_pdf_engine
+
+    install_fake_llm(args)
+
+    try:
+        # "table" rows are resolved by the local pre-extraction pass; "freeform"
+        # records go through the (fake) LLM, so both paths are tracked.
+        for layout in ("table", "freeform"):
+            documents = [
+                build_contact_sheet(args.pdf_pages, offset=index * args.pdf_pages * 100, layout=layout)
+                for index in range(args.documents)
+            ]
+
+            async def process(index: int) -> None:
+                leads, _ = await process_document_for_lead(documents[index], ".pdf", use_cache=False)
+                if not leads:
+                    raise RuntimeError("Document benchmark extracted no leads")
+
+            await measure(
+                f"documents.process_{args.pdf_pages}p_{layout}", process, args.documents,
+                args.document_concurrency, results
+            )
+    finally:
+        shutdown_pdf_engine()
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    regressions = []
+    print(f"\n{'benchmark':<28} {'metric':<12} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, metrics in sorted(results.items()):
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            before, after = previous.get(metric), metrics.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            marker = ""
+            if change * direction < -threshold:
+                marker = "  REGRESSION"
+                regressions.append(f"{name} {metric}: {before} -> {after} ({change:+.1%})")
+            print(f"{name:<28} {metric:<12} {before:>12} {after:>12} {change:>+8.1%}{marker}")
+    return regressions
+
+def parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the Mini-CRM API, database layer and document pipeline")
+    parser.add_argument("--leads", type=int, default=10000, help="Synthetic leads to seed before measuring")
+    parser.add_argument("--iterations", type=int, default=500, help="Requests per API benchmark")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent in-process API clients")
+    parser.add_argument("--documents", type=int, default=4, help="Generated PDFs to process")
+    parser.add_argument("--pdf-pages", type=int, default=20, help="Pages per generated PDF")
+    parser.add_argument("--document-concurrency", type=int, default=2, help="Documents processed concurrently")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated latency per fake LLM call")
+    parser.add_argument("--skip-documents", action="store_true", help="Only run the API benchmarks")
+    parser.add_argument("--workdir", help="Directory for the benchmark database (default: a temp dir)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against a previously saved results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="crm-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    # Configuration is read at import time, so point every store at the
+    # scratch directory before the application modules are imported.
+    os.environ["CRM_DATABASE_FILE"] = os.path.join(workdir, "bench.db")
+    os.environ["CRM_CACHE_FILE"] = os.path.join(workdir, "bench-cache.db")
+    os.environ["CRM_UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+    os.environ["CRM_CACHE_ENABLED"] = "false"
+
+    from database.database import init_database
+
+    init_database()
+    started = time.perf_counter()
+    seed_leads(os.environ["CRM_DATABASE_FILE"], args.leads)
+    print(f"Seeded {args.leads} leads in {time.perf_counter() - started:.1f}s ({workdir})")
+
+    results: Dict[str, Dict[str, float]] = {}
+    asyncio.run(run_api_benchmarks(args, results))
+    if not args.skip_documents:
+        asyncio.run(run_document_benchmarks(args, results))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "leads": args.leads,
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "pdf_pages": args.pdf_pages,
+            "llm_latency_ms": args.llm_latency_ms,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nWrote results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
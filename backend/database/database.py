@@ -1,46 +1,120 @@
+import functools
+import logging
+import os
+import random
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
-from typing import Generator
+from typing import Callable, Dict, Generator, Optional, TypeVar
 
-DATABASE_FILE = "./crm.db"
+from database.migrations import apply_migrations, populate_lead_counters, populate_lead_search
+from database.pool import ConnectionPool
+from services.metrics_service import DB_BUSY_RETRIES, observe_db_query, observe_pool_wait
+
+logger = logging.getLogger(__name__)
+
+DATABASE_FILE = os.getenv("CRM_DATABASE_FILE", "./crm.db")
+DB_POOL_SIZE = int(os.getenv("CRM_DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("CRM_DB_POOL_TIMEOUT", "30"))
+WRITE_RETRY_ATTEMPTS = int(os.getenv("CRM_WRITE_RETRY_ATTEMPTS", "5"))
+WRITE_RETRY_BASE_DELAY = float(os.getenv("CRM_WRITE_RETRY_BASE_DELAY", "0.05"))
+
+T = TypeVar("T")
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DATABASE_FILE,
+                    max_size=DB_POOL_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    query_observer=observe_db_query,
+                    wait_observer=observe_pool_wait,
+                )
+    return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def get_pool_stats() -> Dict[str, object]:
+    return get_pool().stats()
 
 @contextmanager
 def get_db_connection() -> Generator[sqlite3.Connection, None, None]:
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
-
-def create_tables():
+    pool = get_pool()
+    with pool.connection() as conn:
+        # Only the checkout that owns the connection rolls back: a nested
+        # helper's exception may be caught and handled by its caller, whose
+        # open transaction must survive it.
+        outermost = pool.checkout_depth() == 0
+        try:
+            yield conn
+        except Exception:
+            if outermost:
+                conn.rollback()
+            raise
+
+def is_busy_error(error: BaseException) -> bool:
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return "database is locked" in message or "database is busy" in message
+
+def retry_on_busy(func: Callable[..., T]) -> Callable[..., T]:
+    # busy_timeout covers ordinary lock waits; with several server processes a
+    # writer can still get SQLITE_BUSY (timeout exceeded, or a read snapshot
+    # that went stale before its write). The function must be one complete
+    # transaction, so running it again from the start is safe.
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, WRITE_RETRY_ATTEMPTS + 1):
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt == WRITE_RETRY_ATTEMPTS:
+                    raise
+                DB_BUSY_RETRIES.inc(operation=func.__name__)
+                delay = WRITE_RETRY_BASE_DELAY * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                logger.info("%s hit a locked database, retrying in %.0fms", func.__name__, delay * 1000)
+                time.sleep(delay)
+    return wrapper
+
+def rebuild_lead_search():
+    with get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        populate_lead_search(conn.cursor())
+        conn.execute("INSERT INTO leads_fts (leads_fts) VALUES ('optimize')")
+        conn.commit()
+
+def rebuild_lead_counters() -> int:
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS leads (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                phone TEXT,
-                status TEXT NOT NULL DEFAULT 'New',
-                source TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_leads_email ON leads(email)
-        ''')
-        
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_leads_status ON leads(status)
-        ''')
-        
+        conn.execute("BEGIN IMMEDIATE")
+        populate_lead_counters(conn.cursor())
         conn.commit()
+        return conn.execute("SELECT COUNT(*) FROM lead_counters").fetchone()[0]
 
-def init_database():
-    create_tables()
\ No newline at end of file
+@retry_on_busy
+def compact_lead_changes() -> int:
+    # The change feed only reports each lead's latest seq, so superseded
+    # entries can go without affecting any client's "since" cursor.
+    with get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute(
+            "DELETE FROM lead_changes WHERE seq NOT IN (SELECT MAX(seq) FROM lead_changes GROUP BY lead_id)"
+        )
+        conn.commit()
+        return cursor.rowcount
+
+def init_database() -> int:
+    with get_db_connection() as conn:
+        return apply_migrations(conn)
\ No newline at end of file
@@ -0,0 +1,137 @@
+import json
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from database.database import get_db_connection, retry_on_busy
+from database.migrations import BULK_INSERT_FLAG_TABLE, BULK_INSERT_TRIGGERS
+
+LeadRow = Tuple[str, str, Optional[str], str, str]
+
+LEAD_COLUMNS = "id, name, email, phone, status, source"
+EXPORT_CHUNK_SIZE = 1000
+
+def find_existing_emails(conn: sqlite3.Connection, emails: Sequence[str]) -> Set[str]:
+    # One statement for any number of candidates: the list travels as a
+    # single JSON parameter and each value is probed on the email index.
+    if not emails:
+        return set()
+    rows = conn.execute(
+        "SELECT email FROM leads WHERE email IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(emails)),)
+    ).fetchall()
+    return {row["email"] for row in rows}
+
+def fetch_ids_by_email(conn: sqlite3.Connection, emails: Sequence[str]) -> Dict[str, int]:
+    if not emails:
+        return {}
+    rows = conn.execute(
+        "SELECT id, email FROM leads WHERE email IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(emails)),)
+    ).fetchall()
+    return {row["email"]: row["id"] for row in rows}
+
+def insert_new_rows(conn: sqlite3.Connection, rows: Sequence[LeadRow]) -> List[bool]:
+    # Runs inside the caller's write transaction; returns, per row, whether it
+    # was inserted or skipped because its email is taken (in the table or by
+    # an earlier row of the same batch).
+    taken = find_existing_emails(conn, [row[1] for row in rows])
+    inserted: List[bool] = []
+    fresh: List[LeadRow] = []
+    for row in rows:
+        if row[1] in taken:
+            inserted.append(False)
+            continue
+        taken.add(row[1])
+        fresh.append(row)
+        inserted.append(True)
+
+    conn.executemany(
+        """INSERT INTO leads (name, email, phone, status, source) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(email) DO NOTHING""",
+        fresh
+    )
+    return inserted
+
+@retry_on_busy
+def insert_lead_rows(conn: sqlite3.Connection, rows: Sequence[LeadRow]) -> List[bool]:
+    # Bulk path for imports: the per-row counter and search triggers cost more
+    # than the insert itself, so they are switched off by the flag row and
+    # replaced with one set-based catch-up over the new ids.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM leads").fetchone()[0]
+        conn.execute(f"INSERT INTO {BULK_INSERT_FLAG_TABLE} (active) VALUES (1)")
+        inserted = insert_new_rows(conn, rows)
+        conn.execute(f"DELETE FROM {BULK_INSERT_FLAG_TABLE}")
+        for _, _, catch_up in BULK_INSERT_TRIGGERS:
+            conn.execute(catch_up, (last_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return inserted
+
+def build_list_query(
+    status_filter: Optional[str] = None,
+    source_filter: Optional[str] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Tuple[str, List[Any]]:
+    query = f"SELECT {LEAD_COLUMNS} FROM leads"
+    params: List[Any] = []
+    conditions = []
+
+    if status_filter:
+        conditions.append("status = ?")
+        params.append(status_filter)
+
+    if source_filter:
+        conditions.append("source = ?")
+        params.append(source_filter)
+
+    if before_id is not None:
+        conditions.append("id < ?")
+        params.append(before_id)
+
+    if after_id is not None:
+        conditions.append("id > ?")
+        params.append(after_id)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    # Walking forward from after_id needs ascending order so LIMIT keeps the
+    # rows closest to the cursor; callers flip the page back to newest-first.
+    query += " ORDER BY id ASC" if after_id is not None else " ORDER BY id DESC"
+
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+        if offset:
+            query += " OFFSET ?"
+            params.append(offset)
+
+    return query, params
+
+def iter_lead_chunks(
+    status_filter: Optional[str] = None,
+    source_filter: Optional[str] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> Iterator[List[sqlite3.Row]]:
+    # Each chunk checks a connection out and back in, so a slow consumer never
+    # pins a pooled connection or a read snapshot for the whole export.
+    before_id = None
+    while True:
+        query, params = build_list_query(
+            status_filter, source_filter, before_id=before_id, limit=chunk_size
+        )
+        with get_db_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        before_id = rows[-1]["id"]
@@ -0,0 +1,378 @@
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+def phone_digits_sql(column: str) -> str:
+    # Triggers must stay plain SQL (no Python UDFs) so writes from any SQLite
+    # client keep the index in sync; strip the separators phones actually use.
+    expression = column
+    for separator in (" ", "-", "(", ")", "+", ".", "/"):
+        expression = f"REPLACE({expression}, '{separator}', '')"
+    return expression
+
+# Bulk loads hold a row in this table for the length of their write
+# transaction; the gated insert triggers skip while it is there, and the
+# loader runs each trigger's set-based catch-up once instead. The row is
+# deleted before commit, so other connections never see it.
+BULK_INSERT_FLAG_TABLE = "bulk_insert_mode"
+
+def insert_trigger_sql(name: str, body: str, gated: bool = False) -> str:
+    when = f"WHEN NOT EXISTS (SELECT 1 FROM {BULK_INSERT_FLAG_TABLE})" if gated else ""
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS {name} AFTER INSERT ON leads {when}
+        BEGIN
+            {body}
+        END
+    '''
+
+COUNTERS_INSERT_BODY = '''
+    INSERT INTO lead_counters (status, source, count) VALUES (NEW.status, NEW.source, 1)
+    ON CONFLICT(status, source) DO UPDATE SET count = count + 1;
+'''
+
+SEARCH_INSERT_BODY = f'''
+    INSERT INTO leads_fts (rowid, name, email, phone_digits, source)
+    VALUES (NEW.id, NEW.name, NEW.email, {phone_digits_sql("NEW.phone")}, NEW.source);
+'''
+
+# Gated per-row insert triggers, each paired with a statement doing the same
+# work for every lead with id > ?.
+BULK_INSERT_TRIGGERS: List[Tuple[str, str, str]] = [
+    (
+        "trg_leads_counters_insert",
+        COUNTERS_INSERT_BODY,
+        '''
+            INSERT INTO lead_counters (status, source, count)
+            SELECT status, source, COUNT(*) FROM leads WHERE id > ? GROUP BY status, source
+            ON CONFLICT(status, source) DO UPDATE SET count = count + excluded.count
+        ''',
+    ),
+    (
+        "trg_leads_fts_insert",
+        SEARCH_INSERT_BODY,
+        f'''
+            INSERT INTO leads_fts (rowid, name, email, phone_digits, source)
+            SELECT id, name, email, {phone_digits_sql("phone")}, source FROM leads WHERE id > ?
+        ''',
+    ),
+]
+
+def email_normalized_sql(column: str) -> str:
+    # Blocking key for duplicate detection: case and surrounding space are
+    # dropped, "+tag" suffixes removed, and Gmail's ignored dots stripped.
+    email = f"lower(trim({column}))"
+    local = f"substr({email}, 1, instr({email}, '@') - 1)"
+    domain = f"substr({email}, instr({email}, '@') + 1)"
+    base = f"CASE WHEN instr({local}, '+') > 0 THEN substr({local}, 1, instr({local}, '+') - 1) ELSE {local} END"
+    return (
+        f"CASE WHEN instr({email}, '@') = 0 THEN {email} "
+        f"WHEN {domain} IN ('gmail.com', 'googlemail.com') THEN replace({base}, '.', '') || '@gmail.com' "
+        f"ELSE {base} || '@' || {domain} END"
+    )
+
+def phone_normalized_sql(column: str) -> str:
+    # National number as digits: the last ten, so "+1 555 123 4567" and
+    # "(555) 123-4567" share a key. NULL when too short to identify anyone.
+    digits = phone_digits_sql(column)
+    return f"CASE WHEN length({digits}) >= 7 THEN substr({digits}, -10) END"
+
+def populate_lead_counters(cursor: sqlite3.Cursor):
+    cursor.execute("DELETE FROM lead_counters")
+    cursor.execute('''
+        INSERT INTO lead_counters (status, source, count)
+        SELECT status, source, COUNT(*) FROM leads GROUP BY status, source
+    ''')
+
+def populate_lead_search(cursor: sqlite3.Cursor):
+    cursor.execute("DELETE FROM leads_fts")
+    cursor.execute(f'''
+        INSERT INTO leads_fts (rowid, name, email, phone_digits, source)
+        SELECT id, name, email, {phone_digits_sql("phone")}, source FROM leads
+    ''')
+
+def _create_leads(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            phone TEXT,
+            status TEXT NOT NULL DEFAULT 'New',
+            source TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leads_email ON leads(email)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leads_status ON leads(status)
+    ''')
+
+def _create_document_jobs(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_jobs (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            file_extension TEXT NOT NULL,
+            file_path TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            stage TEXT,
+            progress INTEGER NOT NULL DEFAULT 0,
+            use_cache INTEGER NOT NULL DEFAULT 1,
+            created_lead_ids TEXT,
+            duplicates INTEGER NOT NULL DEFAULT 0,
+            extracted_text_length INTEGER,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_document_jobs_status ON document_jobs(status)
+    ''')
+
+def _create_lead_counters(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lead_counters (
+            status TEXT NOT NULL,
+            source TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (status, source)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute(insert_trigger_sql("trg_leads_counters_insert", COUNTERS_INSERT_BODY))
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_leads_counters_delete AFTER DELETE ON leads
+        BEGIN
+            UPDATE lead_counters SET count = count - 1
+            WHERE status = OLD.status AND source = OLD.source;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_leads_counters_update AFTER UPDATE OF status, source ON leads
+        WHEN OLD.status IS NOT NEW.status OR OLD.source IS NOT NEW.source
+        BEGIN
+            UPDATE lead_counters SET count = count - 1
+            WHERE status = OLD.status AND source = OLD.source;
+            INSERT INTO lead_counters (status, source, count) VALUES (NEW.status, NEW.source, 1)
+            ON CONFLICT(status, source) DO UPDATE SET count = count + 1;
+        END
+    ''')
+
+    populate_lead_counters(cursor)
+
+def _create_lead_search(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5(
+            name, email, phone_digits, source,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+
+    cursor.execute(insert_trigger_sql("trg_leads_fts_insert", SEARCH_INSERT_BODY))
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_leads_fts_delete AFTER DELETE ON leads
+        BEGIN
+            DELETE FROM leads_fts WHERE rowid = OLD.id;
+        END
+    ''')
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_leads_fts_update AFTER UPDATE OF name, email, phone, source ON leads
+        BEGIN
+            DELETE FROM leads_fts WHERE rowid = OLD.id;
+            INSERT INTO leads_fts (rowid, name, email, phone_digits, source)
+            VALUES (NEW.id, NEW.name, NEW.email, {phone_digits_sql("NEW.phone")}, NEW.source);
+        END
+    ''')
+
+    populate_lead_search(cursor)
+
+def _add_listing_indexes(cursor: sqlite3.Cursor):
+    # The UNIQUE constraint on email already provides an index.
+    cursor.execute("DROP INDEX IF EXISTS idx_leads_email")
+
+    # Every SQLite index ends with the rowid, so equality filters on these
+    # prefixes come back already in id order: ORDER BY id DESC with a
+    # keyset cursor is answered straight from the index with no sort step.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leads_status_source ON leads(status, source)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leads_source ON leads(source)
+    ''')
+
+def _create_workflow_outbox(cursor: sqlite3.Cursor):
+    # One row per lead and action of a workflow run. Emails are written as
+    # 'pending' and delivered later by draining the outbox; every other
+    # action is recorded with its final status.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS workflow_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            lead_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            status TEXT NOT NULL,
+            recipient TEXT,
+            subject TEXT,
+            body TEXT,
+            detail TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_workflow_outbox_run ON workflow_outbox(run_id)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_workflow_outbox_pending ON workflow_outbox(id) WHERE status = 'pending'
+    ''')
+
+def _create_lead_changes(cursor: sqlite3.Cursor):
+    # Append-only change log: seq only ever grows, so clients can sync with
+    # "changes since seq" and seq doubles as an ETag for lead reads.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lead_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            lead_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_lead_changes_lead ON lead_changes(lead_id, seq)
+    ''')
+
+    for operation, event, row in (("insert", "INSERT", "NEW"), ("update", "UPDATE", "NEW"), ("delete", "DELETE", "OLD")):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_leads_changes_{operation} AFTER {event} ON leads
+            BEGIN
+                INSERT INTO lead_changes (lead_id, operation) VALUES ({row}.id, '{operation}');
+            END
+        ''')
+
+    # Existing leads start the log, so a client can bootstrap from since=0.
+    cursor.execute('''
+        INSERT INTO lead_changes (lead_id, operation) SELECT id, 'insert' FROM leads ORDER BY id
+    ''')
+
+def _add_job_leases(cursor: sqlite3.Cursor):
+    # Several server processes share the job table; a worker owns a job only
+    # while its lease is fresh, so a crashed process's jobs can be reclaimed.
+    cursor.execute("ALTER TABLE document_jobs ADD COLUMN lease_owner TEXT")
+    cursor.execute("ALTER TABLE document_jobs ADD COLUMN lease_expires_at REAL")
+
+def _add_dedup_keys(cursor: sqlite3.Cursor):
+    # Virtual generated columns: computed by SQLite itself, so every writer
+    # keeps them right, and only their indexes take space.
+    cursor.execute(f'''
+        ALTER TABLE leads ADD COLUMN email_normalized TEXT
+        GENERATED ALWAYS AS ({email_normalized_sql("email")}) VIRTUAL
+    ''')
+    cursor.execute(f'''
+        ALTER TABLE leads ADD COLUMN phone_normalized TEXT
+        GENERATED ALWAYS AS ({phone_normalized_sql("phone")}) VIRTUAL
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leads_email_normalized ON leads(email_normalized)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leads_phone_normalized ON leads(phone_normalized)
+    ''')
+
+def _create_dedupe_runs(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dedupe_runs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'running',
+            stage TEXT,
+            merge INTEGER NOT NULL DEFAULT 0,
+            threshold REAL NOT NULL,
+            result TEXT,
+            error TEXT,
+            owner TEXT,
+            heartbeat_at REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_dedupe_runs_status ON dedupe_runs(status)
+    ''')
+
+def _gate_bulk_insert_triggers(cursor: sqlite3.Cursor):
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {BULK_INSERT_FLAG_TABLE} (active INTEGER)")
+    for name, body, _ in BULK_INSERT_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(insert_trigger_sql(name, body, gated=True))
+
+def _add_outbox_claims(cursor: sqlite3.Cursor):
+    # A drain claims a batch by moving it to 'sending' under its own lease, so
+    # concurrent drains never send the same email; claims whose lease ran out
+    # (the drain crashed) go back to 'pending'.
+    cursor.execute("ALTER TABLE workflow_outbox ADD COLUMN lease_owner TEXT")
+    cursor.execute("ALTER TABLE workflow_outbox ADD COLUMN lease_expires_at REAL")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_workflow_outbox_sending ON workflow_outbox(lease_expires_at)
+        WHERE status = 'sending'
+    ''')
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "create leads", _create_leads),
+    (2, "create document_jobs", _create_document_jobs),
+    (3, "create lead_counters", _create_lead_counters),
+    (4, "create leads_fts", _create_lead_search),
+    (5, "add listing indexes", _add_listing_indexes),
+    (6, "create workflow_outbox", _create_workflow_outbox),
+    (7, "create lead_changes", _create_lead_changes),
+    (8, "add document job leases", _add_job_leases),
+    (9, "add dedup keys", _add_dedup_keys),
+    (10, "create dedupe_runs", _create_dedupe_runs),
+    (11, "gate bulk insert triggers", _gate_bulk_insert_triggers),
+    (12, "add outbox claims", _add_outbox_claims),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    for version, name, migrate in MIGRATIONS:
+        if get_schema_version(conn) >= version:
+            continue
+        # BEGIN IMMEDIATE serializes concurrent starters; re-check the version
+        # under the lock so a migration another process just applied is skipped.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            migrate(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Applied database migration %d: %s", version, name)
+
+    conn.execute("PRAGMA optimize")
+    return get_schema_version(conn)
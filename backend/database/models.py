@@ -1,8 +1,39 @@
 from pydantic import BaseModel, validator
-from typing import Optional, List
+from typing import Dict, Optional, List, Literal
 from datetime import datetime
 import re
 
+STATUS_CHOICES = ('New', 'Contacted', 'Qualified', 'Proposal', 'Negotiation', 'Closed Won', 'Closed Lost')
+SOURCE_CHOICES = ('Manual', 'Document', 'Web Form', 'Email', 'Phone', 'Social Media', 'Referral')
+VALID_STATUSES = frozenset(STATUS_CHOICES)
+VALID_SOURCES = frozenset(SOURCE_CHOICES)
+PHONE_PATTERN = re.compile(r'^\+?[\d\s\-\(\)]{7,}$')
+
+# Plain functions so bulk paths can apply the LeadBase rules to raw values
+# without building a model per row; the validators below delegate to them.
+def clean_name(v):
+    if not v or not v.strip():
+        raise ValueError('Name cannot be empty')
+    if len(v.strip()) < 2:
+        raise ValueError('Name must be at least 2 characters long')
+    return v.strip()
+
+def check_phone(v):
+    if v and v != 'N/A':
+        if not PHONE_PATTERN.match(v):
+            raise ValueError('Invalid phone number format')
+    return v
+
+def check_status(v):
+    if v not in VALID_STATUSES:
+        raise ValueError(f'Status must be one of: {", ".join(STATUS_CHOICES)}')
+    return v
+
+def check_source(v):
+    if v not in VALID_SOURCES:
+        raise ValueError(f'Source must be one of: {", ".join(SOURCE_CHOICES)}')
+    return v
+
 class LeadBase(BaseModel):
     name: str
     email: str
@@ -12,33 +43,19 @@ class LeadBase(BaseModel):
 
     @validator('name')
     def validate_name(cls, v):
-        if not v or not v.strip():
-            raise ValueError('Name cannot be empty')
-        if len(v.strip()) < 2:
-            raise ValueError('Name must be at least 2 characters long')
-        return v.strip()
+        return clean_name(v)
 
     @validator('phone')
     def validate_phone(cls, v):
-        if v and v != 'N/A':
-            phone_pattern = re.compile(r'^\+?[\d\s\-\(\)]{7,}$')
-            if not phone_pattern.match(v):
-                raise ValueError('Invalid phone number format')
-        return v
+        return check_phone(v)
 
     @validator('status')
     def validate_status(cls, v):
-        valid_statuses = ['New', 'Contacted', 'Qualified', 'Proposal', 'Negotiation', 'Closed Won', 'Closed Lost']
-        if v not in valid_statuses:
-            raise ValueError(f'Status must be one of: {", ".join(valid_statuses)}')
-        return v
+        return check_status(v)
 
     @validator('source')
     def validate_source(cls, v):
-        valid_sources = ['Manual', 'Document', 'Web Form', 'Email', 'Phone', 'Social Media', 'Referral']
-        if v not in valid_sources:
-            raise ValueError(f'Source must be one of: {", ".join(valid_sources)}')
-        return v
+        return check_source(v)
 
 class LeadCreate(LeadBase):
     pass
@@ -54,6 +71,56 @@ class LeadInDB(LeadBase):
     class Config:
         from_attributes = True
 
+class LeadCounter(BaseModel):
+    status: str
+    source: str
+    count: int
+
+class LeadStats(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+    by_source: Dict[str, int]
+    by_status_source: List[LeadCounter]
+
+class LeadChange(BaseModel):
+    seq: int
+    lead_id: int
+    operation: Literal["upsert", "delete"]
+    lead: Optional[LeadInDB] = None
+
+class LeadChangesResponse(BaseModel):
+    since: int
+    latest: int
+    has_more: bool
+    changes: List[LeadChange]
+
+class DuplicateGroup(BaseModel):
+    primary_id: int
+    duplicate_ids: List[int]
+    score: float
+
+class LeadDedupeResponse(BaseModel):
+    blocks: int
+    skipped_blocks: int
+    candidate_pairs: int
+    duplicate_groups: int
+    duplicates: int
+    merged: int
+    groups: List[DuplicateGroup]
+    groups_truncated: bool = False
+    elapsed_seconds: float
+
+class DedupeRun(BaseModel):
+    id: str
+    status: Literal["running", "completed", "failed"]
+    stage: Optional[str] = None
+    merge: bool = False
+    threshold: float
+    result: Optional[LeadDedupeResponse] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
 class LeadInteractionRequest(BaseModel):
     query: str
     
@@ -69,7 +136,108 @@ class LeadInteractionResponse(BaseModel):
     response: str
     timestamp: datetime = datetime.now()
 
+class ImportRowError(BaseModel):
+    row: int
+    status: Literal["duplicate", "invalid"]
+    field: Optional[str] = None
+    error: str
+
+class LeadImportResponse(BaseModel):
+    rows: int
+    created: int
+    duplicates: int
+    invalid: int
+    column_mapping: Dict[str, str]
+    errors: List[ImportRowError]
+    errors_truncated: bool = False
+    elapsed_seconds: float
+
+class WorkflowAction(BaseModel):
+    type: Literal["send_email", "update_status"]
+    subject: Optional[str] = None
+    body: Optional[str] = None
+    new_status: Optional[str] = None
+
+    @validator('new_status', always=True)
+    def validate_new_status(cls, v, values):
+        if values.get('type') == 'update_status':
+            if not v:
+                raise ValueError('new_status is required for update_status')
+            return check_status(v)
+        return v
+
+    @validator('body', always=True)
+    def validate_email_fields(cls, v, values):
+        if values.get('type') == 'send_email' and (not values.get('subject') or not v):
+            raise ValueError('subject and body are required for send_email')
+        return v
+
+class WorkflowRunRequest(BaseModel):
+    status_filter: Optional[str] = None
+    source_filter: Optional[str] = None
+    actions: List[WorkflowAction]
+    rate_limit: Optional[float] = None
+
+    @validator('status_filter')
+    def validate_status_filter(cls, v):
+        return check_status(v) if v is not None else v
+
+    @validator('source_filter')
+    def validate_source_filter(cls, v):
+        return check_source(v) if v is not None else v
+
+    @validator('actions')
+    def validate_actions(cls, v):
+        if not v:
+            raise ValueError('At least one action is required')
+        return v
+
+    @validator('rate_limit')
+    def validate_rate_limit(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError('rate_limit must be positive')
+        return v
+
+class WorkflowRunResponse(BaseModel):
+    run_id: str
+    matched: int
+    status_updated: int
+    emails_queued: int
+    skipped: int
+    failed: int
+    elapsed_seconds: float
+
+class OutboxDrainResponse(BaseModel):
+    sent: int
+    failed: int
+    remaining: int
+
+class DocumentJob(BaseModel):
+    id: str
+    filename: str
+    status: Literal["queued", "processing", "completed", "failed"]
+    stage: Optional[str] = None
+    progress: int = 0
+    created_leads: List[LeadInDB] = []
+    duplicates: int = 0
+    extracted_text_length: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
 class DocumentUploadResponse(BaseModel):
     message: str
     leads: List[LeadInDB]
-    extracted_text_length: int
\ No newline at end of file
+    extracted_text_length: int
+
+class BulkLeadResult(BaseModel):
+    index: int
+    status: Literal["created", "duplicate", "invalid"]
+    lead: Optional[LeadInDB] = None
+    error: Optional[str] = None
+
+class BulkLeadResponse(BaseModel):
+    created: int
+    duplicates: int
+    invalid: int
+    results: List[BulkLeadResult]
\ No newline at end of file
@@ -0,0 +1,246 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Generator, List, Optional
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -20000,
+    "mmap_size": 268435456,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
+QueryObserver = Callable[[str, str, float], None]
+WaitObserver = Callable[[float, bool], None]
+
+class PoolTimeoutError(Exception):
+    pass
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # execute() covers preparation and the first step; a SELECT produces the
+    # rest of its rows during fetch, so that time is reported separately.
+    def execute(self, sql, parameters=()):
+        self._last_sql = sql
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.query_observer(sql, "execute", time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._last_sql = sql
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.query_observer(sql, "execute", time.perf_counter() - started)
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self.connection.query_observer(getattr(self, "_last_sql", ""), "fetch", time.perf_counter() - started)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+class InstrumentedConnection(sqlite3.Connection):
+    query_observer: QueryObserver
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self.query_observer("COMMIT", "execute", time.perf_counter() - started)
+
+class ConnectionPool:
+    def __init__(
+        self,
+        database: str,
+        max_size: int = 8,
+        timeout: float = 30.0,
+        pragmas: Optional[Dict[str, object]] = None,
+        query_observer: Optional[QueryObserver] = None,
+        wait_observer: Optional[WaitObserver] = None,
+    ):
+        if max_size < 1:
+            raise ValueError("Pool max_size must be at least 1")
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.query_observer = query_observer
+        self.wait_observer = wait_observer
+
+        self._condition = threading.Condition(threading.Lock())
+        self._idle: List[sqlite3.Connection] = []
+        self._all: List[sqlite3.Connection] = []
+        self._local = threading.local()
+        self._closed = False
+
+        self._checkouts = 0
+        self._affinity_hits = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.query_observer is not None:
+            conn = sqlite3.connect(self.database, check_same_thread=False, factory=InstrumentedConnection)
+            conn.query_observer = self.query_observer
+        else:
+            conn = sqlite3.connect(self.database, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _take_idle(self) -> Optional[sqlite3.Connection]:
+        preferred = getattr(self._local, "last_connection", None)
+        if preferred is not None and preferred in self._idle:
+            self._idle.remove(preferred)
+            self._affinity_hits += 1
+            return preferred
+        if self._idle:
+            return self._idle.pop()
+        return None
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+            self._checkouts += 1
+
+            conn = self._take_idle()
+            if conn is not None:
+                return conn
+
+            if len(self._all) < self.max_size:
+                # Reserve the slot before connecting so concurrent callers
+                # cannot overshoot max_size while the lock is released.
+                self._all.append(None)
+                reserved = True
+            else:
+                reserved = False
+
+        if reserved:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._condition:
+                    self._all.remove(None)
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self._all[self._all.index(None)] = conn
+            return conn
+
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        timed_out = False
+        try:
+            with self._condition:
+                self._waits += 1
+                try:
+                    while True:
+                        if self._closed:
+                            raise RuntimeError("Connection pool is closed")
+                        conn = self._take_idle()
+                        if conn is not None:
+                            return conn
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            timed_out = True
+                            raise PoolTimeoutError(
+                                f"Timed out after {self.timeout}s waiting for a database connection"
+                            )
+                        self._condition.wait(remaining)
+                finally:
+                    waited = time.perf_counter() - started
+                    self._wait_time += waited
+        finally:
+            if self.wait_observer is not None:
+                self.wait_observer(waited, timed_out)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self._local.last_connection = conn
+        with self._condition:
+            if self._closed:
+                conn.close()
+                return
+            self._idle.append(conn)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self) -> Generator[sqlite3.Connection, None, None]:
+        # Nested checkouts on the same thread share the outer connection so
+        # helpers that open their own context cannot deadlock a small pool.
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self.acquire()
+        self._local.held = conn
+        self._local.depth = 0
+        try:
+            yield conn
+        finally:
+            self._local.held = None
+            self.release(conn)
+
+    def checkout_depth(self) -> int:
+        # Inside connection(): 0 for the outermost checkout on this thread,
+        # n for the nth nested one sharing its connection.
+        return getattr(self._local, "depth", 0)
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._all = [conn for conn in self._all if conn is not None and conn not in idle]
+            self._condition.notify_all()
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict[str, object]:
+        with self._condition:
+            size = sum(1 for conn in self._all if conn is not None)
+            return {
+                "max_size": self.max_size,
+                "size": size,
+                "idle": len(self._idle),
+                "in_use": size - len(self._idle),
+                "checkouts": self._checkouts,
+                "affinity_hits": self._affinity_hits,
+                "waits": self._waits,
+                "wait_time_seconds": round(self._wait_time, 6),
+                "timeouts": self._timeouts,
+            }
@@ -0,0 +1,27 @@
+import re
+import sqlite3
+from typing import Any, List, Sequence
+
+TABLE_SCAN_PATTERN = re.compile(r"^SCAN (\w+)(?! USING)")
+
+def explain_query_plan(conn: sqlite3.Connection, query: str, params: Sequence[Any] = ()) -> List[str]:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", list(params)).fetchall()
+    return [row[3] for row in rows]
+
+def find_plan_violations(
+    conn: sqlite3.Connection,
+    query: str,
+    params: Sequence[Any] = (),
+    allow_rowid_scan: bool = False,
+) -> List[str]:
+    # A bare "SCAN <table>" walks the whole table; it is only acceptable for an
+    # unfiltered listing, where the rowid order matches ORDER BY id and LIMIT
+    # stops the walk after one page. Temp B-trees mean SQLite sorts or
+    # deduplicates the full result before the first row is returned.
+    violations = []
+    for detail in explain_query_plan(conn, query, params):
+        if "USE TEMP B-TREE" in detail:
+            violations.append(detail)
+        elif TABLE_SCAN_PATTERN.match(detail) and not allow_rowid_scan:
+            violations.append(detail)
+    return violations
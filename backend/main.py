@@ -1,10 +1,19 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 
-from routers import leads, document_upload
-from database.database import init_database
+from routers import leads, document_upload, workflows
+from database.database import init_database, close_pool, get_pool_stats
+from services.cache_service import close_content_cache, get_content_cache, get_interaction_cache
+from services.dedup_service import stop_dedupe_runner
+from services.job_service import get_job_manager, start_job_manager, stop_job_manager
+from services.llm_runtime import close_llm_runtime, init_llm_runtime
+from services.metrics_service import MetricsMiddleware, registry, render_metrics
+from services.profiling_service import ProfilingMiddleware
+from services.text_extraction_service import shutdown_pdf_engine
+from services.upload_service import UploadSizeLimitMiddleware
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,8 +23,21 @@ async def lifespan(app: FastAPI):
     logger.info("Starting up Mini-CRM API...")
     init_database()
     logger.info("Database initialized")
+    try:
+        init_llm_runtime()
+        logger.info("LLM runtime initialized")
+    except Exception as e:
+        logger.warning("LLM runtime unavailable at startup, will retry on first use: %s", e)
+    await start_job_manager()
+    logger.info("Document job workers started")
     yield
     logger.info("Shutting down Mini-CRM API...")
+    await stop_job_manager()
+    await stop_dedupe_runner()
+    await close_llm_runtime()
+    shutdown_pdf_engine()
+    close_content_cache()
+    close_pool()
 
 app = FastAPI(
     title="Mini-CRM Backend",
@@ -24,6 +46,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.add_middleware(UploadSizeLimitMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -34,6 +59,16 @@ app.add_middleware(
 
 app.include_router(leads.router)
 app.include_router(document_upload.router)
+app.include_router(workflows.router)
+
+registry.gauge(
+    "crm_db_pool_connections", "Pooled database connections by state", ("state",),
+    lambda: [((state,), get_pool_stats()[state]) for state in ("in_use", "idle")]
+)
+registry.gauge(
+    "crm_document_jobs_queued", "Document jobs waiting for a worker", (),
+    lambda: [((), get_job_manager().stats()["queued"])]
+)
 
 @app.get("/")
 async def root():
@@ -41,4 +76,19 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "Mini-CRM API"}
\ No newline at end of file
+    return {"status": "healthy", "service": "Mini-CRM API"}
+
+@app.get("/stats")
+def service_stats():
+    # Plain def: the content cache stats run SQLite aggregates, which belong
+    # in the threadpool rather than on the event loop.
+    return {
+        "database": get_pool_stats(),
+        "content_cache": get_content_cache().stats(),
+        "interaction_cache": get_interaction_cache().stats(),
+        "document_jobs": get_job_manager().stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
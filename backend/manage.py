@@ -0,0 +1,193 @@
+import argparse
+import itertools
+import logging
+import os
+import sys
+
+from database.database import (
+    compact_lead_changes, get_db_connection, init_database, rebuild_lead_counters, rebuild_lead_search
+)
+from database.query_plans import explain_query_plan, find_plan_violations
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def rebuild_counters(args: argparse.Namespace) -> int:
+    init_database()
+    groups = rebuild_lead_counters()
+    logger.info("Rebuilt lead counters: %d status/source groups", groups)
+    return 0
+
+def rebuild_search(args: argparse.Namespace) -> int:
+    init_database()
+    rebuild_lead_search()
+    logger.info("Rebuilt lead search index")
+    return 0
+
+def compact_changes(args: argparse.Namespace) -> int:
+    init_database()
+    removed = compact_lead_changes()
+    logger.info("Removed %d superseded lead change entries", removed)
+    return 0
+
+def migrate(args: argparse.Namespace) -> int:
+    version = init_database()
+    logger.info("Database schema is at version %d", version)
+    return 0
+
+def drain_outbox(args: argparse.Namespace) -> int:
+    from services.workflow_service import drain_outbox as drain
+
+    init_database()
+    result = drain(args.limit)
+    logger.info("Sent %d outbox emails, %d failed, %d still pending", result.sent, result.failed, result.remaining)
+    return 1 if result.failed else 0
+
+def dedupe(args: argparse.Namespace) -> int:
+    from services.dedup_service import DedupeRunner
+
+    init_database()
+    runner = DedupeRunner()
+    try:
+        result = runner.run(merge=args.merge, threshold=args.threshold)
+    finally:
+        runner.shutdown()
+    for group in result.groups:
+        logger.info("Lead #%d duplicates: %s (score %.2f)", group.primary_id, group.duplicate_ids, group.score)
+    logger.info(
+        "Found %d duplicate groups (%d duplicate leads), merged %d, skipped %d oversized blocks in %.1fs",
+        result.duplicate_groups, result.duplicates, result.merged, result.skipped_blocks, result.elapsed_seconds
+    )
+    return 0
+
+def serve(args: argparse.Namespace) -> int:
+    import uvicorn
+
+    # Migrate once here so worker processes start against the final schema.
+    init_database()
+    logger.info("Serving on %s:%d with %d worker process(es)", args.host, args.port, args.workers)
+    # Workers share the SQLite database (WAL, busy retries on writes), the
+    # file-backed content cache and the job table; per-process state is
+    # versioned by the database, so any worker can serve any request.
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        access_log=False,
+    )
+    return 0
+
+def listing_query_cases():
+    from database.leads import build_list_query
+
+    for status_filter, source_filter, cursor, offset in itertools.product(
+        (None, "New"), (None, "Manual"), (None, "before_id", "after_id"), (0, 100)
+    ):
+        if cursor and offset:
+            continue
+        cursor_args = {cursor: 1000} if cursor else {}
+        query, params = build_list_query(
+            status_filter, source_filter, limit=100, offset=offset, **cursor_args
+        )
+        filtered = bool(status_filter or source_filter)
+        yield query, params, not filtered
+
+def check_plans(args: argparse.Namespace) -> int:
+    init_database()
+    failures = 0
+    with get_db_connection() as conn:
+        for query, params, allow_rowid_scan in listing_query_cases():
+            violations = find_plan_violations(conn, query, params, allow_rowid_scan=allow_rowid_scan)
+            if violations:
+                failures += 1
+                logger.error("Query plan regression for %s %s", " ".join(query.split()), params)
+                for detail in explain_query_plan(conn, query, params):
+                    logger.error("    %s", detail)
+    if failures:
+        logger.error("%d listing queries fall back to a table scan or temp B-tree sort", failures)
+        return 1
+    logger.info("All listing queries use an index without a sort step")
+    return 0
+
+def check_serialization(args: argparse.Namespace) -> int:
+    from database.models import LeadInDB
+    from database.leads import LEAD_COLUMNS
+    from services.serialization_service import dumps, trusted_lead
+
+    init_database()
+    mismatches = 0
+    with get_db_connection() as conn:
+        # Listing rows omit the timestamps; single-lead and changes rows carry them.
+        for columns in (LEAD_COLUMNS, f"{LEAD_COLUMNS}, created_at, updated_at"):
+            rows = conn.execute(f"SELECT {columns} FROM leads ORDER BY id LIMIT ?", (args.limit,)).fetchall()
+            for row in rows:
+                expected = LeadInDB.model_validate(dict(row)).model_dump_json().encode("utf-8")
+                actual = dumps(trusted_lead(row))
+                if actual != expected:
+                    mismatches += 1
+                    logger.error("Lead %s serializes differently:\n    %s\n    %s", row["id"], expected, actual)
+    if mismatches:
+        logger.error("%d lead rows do not serialize byte-for-byte like LeadInDB", mismatches)
+        return 1
+    logger.info("Trusted lead serialization matches LeadInDB")
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mini-CRM maintenance commands")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    subcommands.add_parser(
+        "rebuild-counters", help="Recompute lead_counters from the leads table"
+    ).set_defaults(handler=rebuild_counters)
+
+    subcommands.add_parser(
+        "rebuild-search", help="Rebuild and optimize the leads_fts full-text index"
+    ).set_defaults(handler=rebuild_search)
+
+    subcommands.add_parser(
+        "compact-changes", help="Drop lead change log entries superseded by a newer change to the same lead"
+    ).set_defaults(handler=compact_changes)
+
+    subcommands.add_parser(
+        "migrate", help="Apply pending schema migrations"
+    ).set_defaults(handler=migrate)
+
+    subcommands.add_parser(
+        "check-plans", help="Fail if a supported lead listing query scans the table or sorts in a temp B-tree"
+    ).set_defaults(handler=check_plans)
+
+    serialization_parser = subcommands.add_parser(
+        "check-serialization", help="Fail if a stored lead serializes differently from LeadInDB on the fast path"
+    )
+    serialization_parser.add_argument("--limit", type=int, default=1000, help="Rows to compare per column set")
+    serialization_parser.set_defaults(handler=check_serialization)
+
+    drain_parser = subcommands.add_parser(
+        "drain-outbox", help="Send pending workflow emails through the configured mail backend"
+    )
+    drain_parser.add_argument("--limit", type=int, help="Maximum number of emails to send")
+    drain_parser.set_defaults(handler=drain_outbox)
+
+    dedupe_parser = subcommands.add_parser(
+        "dedupe", help="Find likely duplicate leads by normalized email and phone with fuzzy name matching"
+    )
+    dedupe_parser.add_argument("--merge", action="store_true", help="Merge each group into its oldest lead")
+    dedupe_parser.add_argument("--threshold", type=float, default=float(os.getenv("CRM_DEDUP_THRESHOLD", "0.8")))
+    dedupe_parser.set_defaults(handler=dedupe)
+
+    serve_parser = subcommands.add_parser("serve", help="Run the API with one or more worker processes")
+    serve_parser.add_argument("--host", default=os.getenv("CRM_HOST", "127.0.0.1"))
+    serve_parser.add_argument("--port", type=int, default=int(os.getenv("CRM_PORT", "8000")))
+    serve_parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("CRM_WORKERS", "1")), help="Server processes (e.g. one per core)"
+    )
+    serve_parser.add_argument("--log-level", default="info")
+    serve_parser.set_defaults(handler=serve)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,22 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, status
-from typing import List
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List, Optional
+import csv
+import json
+import logging
 import os
 
 from services.document_processing_service import process_document_for_lead, DocumentProcessingError
-from database.models import DocumentUploadResponse
-from routers.leads import create_lead
+from database.models import DocumentJob, DocumentUploadResponse, LeadImportResponse
+from services.job_service import get_job, get_job_manager
+from services.lead_service import bulk_create_leads
+from services.metrics_service import DOCUMENT_STAGE_LATENCY, span
+from services.import_service import IMPORT_EXTENSIONS, LeadImportError, import_leads_file
+from services.upload_service import (
+    MAX_FILE_SIZE, MAX_IMPORT_SIZE, SpooledUpload, UploadTooLargeError, spool_upload
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
@@ -14,10 +26,7 @@ ALLOWED_CONTENT_TYPES = {
     "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx"
 }
 
-MAX_FILE_SIZE = 10 * 1024 * 1024
-
-@router.post("/upload", response_model=DocumentUploadResponse, status_code=status.HTTP_201_CREATED)
-async def upload_document(file: UploadFile = File(...)):
+def validate_upload(file: UploadFile):
     if file.content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -29,30 +38,39 @@ async def upload_document(file: UploadFile = File(...)):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Filename is required"
         )
+
+async def receive_upload(file: UploadFile, file_extension: str, max_size: int = MAX_FILE_SIZE) -> SpooledUpload:
+    try:
+        with span(DOCUMENT_STAGE_LATENCY, "read_upload", stage="read_upload"):
+            return await spool_upload(file, suffix=file_extension, max_size=max_size)
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=str(e)
+        )
+
+@router.post("/upload", response_model=DocumentUploadResponse, status_code=status.HTTP_201_CREATED)
+async def upload_document(
+    file: UploadFile = File(...),
+    no_cache: bool = Query(False, description="Bypass cached extraction results")
+):
+    validate_upload(file)
+    file_extension = os.path.splitext(file.filename)[1].lower()
+    upload = await receive_upload(file, file_extension)
     
     try:
-        contents = await file.read()
-        
-        if len(contents) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE} bytes"
-            )
-        
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        
-        leads_data, text_length = await process_document_for_lead(contents, file_extension)
+        leads_data, text_length = await process_document_for_lead(
+            upload.path, file_extension, use_cache=not no_cache, content_digest=upload.sha256
+        )
         
+        with span(DOCUMENT_STAGE_LATENCY, "save_leads", stage="save_leads"):
+            bulk_result = await run_in_threadpool(bulk_create_leads, leads_data)
         created_leads = []
-        for lead_data in leads_data:
-            try:
-                created_lead = create_lead(lead_data)
-                created_leads.append(created_lead)
-            except HTTPException as e:
-                if e.status_code == status.HTTP_400_BAD_REQUEST and "email already exists" in e.detail:
-                    print(f"Skipping lead due to duplicate email: {lead_data.email}")
-                else:
-                    raise
+        for result in bulk_result.results:
+            if result.status == "created":
+                created_leads.append(result.lead)
+            else:
+                logger.info("Skipping lead %s: %s", leads_data[result.index].email, result.error)
 
         if not created_leads:
             raise HTTPException(
@@ -66,6 +84,8 @@ async def upload_document(file: UploadFile = File(...)):
             extracted_text_length=text_length
         )
         
+    except HTTPException:
+        raise
     except DocumentProcessingError as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
@@ -76,6 +96,83 @@ async def upload_document(file: UploadFile = File(...)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process document: {str(e)}"
         )
+    finally:
+        upload.discard()
+
+def parse_column_mapping(column_mapping: Optional[str]) -> Optional[Dict[str, str]]:
+    if not column_mapping:
+        return None
+    try:
+        mapping = json.loads(column_mapping)
+    except json.JSONDecodeError:
+        mapping = None
+    if not isinstance(mapping, dict) or not all(isinstance(v, str) for v in mapping.values()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='column_mapping must be a JSON object such as {"email": "E-mail Address"}'
+        )
+    return mapping
+
+@router.post("/import", response_model=LeadImportResponse)
+async def import_leads(
+    file: UploadFile = File(...),
+    column_mapping: Optional[str] = Form(None, description="JSON object mapping lead fields to file column headers"),
+    default_status: str = Query("New", description="Status for rows without one"),
+    default_source: str = Query("Document", description="Source for rows without one")
+):
+    file_extension = os.path.splitext(file.filename or "")[1].lower()
+    if file_extension not in IMPORT_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid file type. Allowed extensions: {', '.join(IMPORT_EXTENSIONS)}"
+        )
+    mapping = parse_column_mapping(column_mapping)
+
+    upload = await receive_upload(file, file_extension, max_size=MAX_IMPORT_SIZE)
+    try:
+        # Parsing and inserting are CPU and disk bound; keep them off the loop.
+        return await run_in_threadpool(
+            import_leads_file,
+            upload.path,
+            file_extension,
+            column_mapping=mapping,
+            default_status=default_status,
+            default_source=default_source
+        )
+    except (LeadImportError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to import leads: {str(e)}"
+        )
+    finally:
+        upload.discard()
+
+@router.post("/jobs", response_model=DocumentJob, status_code=status.HTTP_202_ACCEPTED)
+async def submit_document_job(
+    file: UploadFile = File(...),
+    no_cache: bool = Query(False, description="Bypass cached extraction results")
+):
+    validate_upload(file)
+
+    file_extension = os.path.splitext(file.filename)[1].lower()
+    upload = await receive_upload(file, file_extension)
+    try:
+        job_id = await get_job_manager().submit(
+            file.filename, file_extension, upload, use_cache=not no_cache
+        )
+    finally:
+        upload.discard()
+    return await run_in_threadpool(get_job, job_id)
+
+@router.get("/jobs/{job_id}", response_model=DocumentJob)
+def read_document_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
 
 @router.get("/supported-formats")
 async def get_supported_formats():
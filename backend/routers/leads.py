@@ -1,16 +1,48 @@
-from fastapi import APIRouter, HTTPException, status, Query
-from typing import List, Optional
+from fastapi import APIRouter, Body, Header, HTTPException, status, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import csv
+import io
+import json
+import re
 import sqlite3
 
-from database.database import get_db_connection
-from database.models import LeadCreate, LeadUpdate, LeadInDB
+from database.database import get_db_connection, retry_on_busy
+from database.leads import EXPORT_CHUNK_SIZE, LEAD_COLUMNS, build_list_query, iter_lead_chunks
+from database.models import (
+    LeadCreate, LeadUpdate, LeadInDB, BulkLeadResponse, DedupeRun, LeadChangesResponse, LeadCounter,
+    LeadStats
+)
+from services.cache_service import get_interaction_cache
+from services.dedup_service import (
+    DEDUP_THRESHOLD, describe_match, find_likely_duplicates, get_dedupe_run, get_dedupe_runner
+)
+from services.lead_service import bulk_create_leads
+from services.metrics_service import DEDUP_CHECKS
+from services.serialization_service import json_response, trusted_lead, trusted_leads_response
 
 router = APIRouter(prefix="/leads", tags=["leads"])
 
 @router.post("/", response_model=LeadInDB, status_code=status.HTTP_201_CREATED)
-def create_lead(lead: LeadCreate):
+@retry_on_busy
+def create_lead(
+    lead: LeadCreate,
+    allow_duplicate: bool = Query(False, description="Create the lead even if it looks like an existing one")
+):
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        # Held from the duplicate check through the insert.
+        conn.execute("BEGIN IMMEDIATE")
+        if not allow_duplicate:
+            match = find_likely_duplicates(conn, [(lead.name, lead.email, lead.phone)])[0]
+            DEDUP_CHECKS.inc(outcome="duplicate" if match else "unique")
+            if match is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"{describe_match(match)}. Set allow_duplicate=true to create it anyway."
+                )
         try:
             cursor.execute(
                 "INSERT INTO leads (name, email, phone, status, source) VALUES (?, ?, ?, ?, ?)",
@@ -25,62 +57,332 @@ def create_lead(lead: LeadCreate):
                 detail="Lead with this email already exists"
             )
 
+BULK_MAX_ROWS = 100000
+
+@router.post("/bulk", response_model=BulkLeadResponse)
+def create_leads_bulk(
+    leads: List[Dict[str, Any]] = Body(..., description="Leads to create"),
+    allow_duplicates: bool = Query(False, description="Skip the likely-duplicate check")
+):
+    if len(leads) > BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Bulk requests are limited to {BULK_MAX_ROWS} leads"
+        )
+    return bulk_create_leads(leads, check_duplicates=not allow_duplicates)
+
+@router.post("/dedupe", response_model=DedupeRun, status_code=status.HTTP_202_ACCEPTED)
+async def dedupe_leads(
+    merge: bool = Query(False, description="Merge each group into its oldest lead instead of only reporting it"),
+    threshold: float = Query(DEDUP_THRESHOLD, ge=0.5, le=1.0, description="Minimum match score")
+):
+    # A full-table scan takes minutes on large tables, so it runs in the
+    # background and is polled through GET /leads/dedupe/{run_id}.
+    run_id = await get_dedupe_runner().submit(merge, threshold)
+    if run_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A dedupe run is already in progress"
+        )
+    return await run_in_threadpool(get_dedupe_run, run_id)
+
+@router.get("/dedupe/{run_id}", response_model=DedupeRun)
+def read_dedupe_run(run_id: str):
+    run = get_dedupe_run(run_id)
+    if run is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dedupe run not found"
+        )
+    return run
+
+EXPORT_CSV_FIELDS = ["id", "name", "email", "phone", "status", "source"]
+
+SEARCH_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+PHONE_QUERY_PATTERN = re.compile(r"^[\d\s\-\(\)\+\./]+$")
+
+def build_fts_match(q: Optional[str] = None, phone_filter: Optional[str] = None) -> Optional[str]:
+    clauses = []
+
+    if q:
+        stripped = q.strip()
+        digits = re.sub(r"\D", "", stripped)
+        if PHONE_QUERY_PATTERN.match(stripped) and len(digits) >= 3:
+            clauses.append(f'phone_digits : "{digits}"*')
+        else:
+            # Every token becomes a quoted prefix term, which both enables
+            # type-ahead matching and neutralizes FTS5 query syntax in input.
+            tokens = SEARCH_TOKEN_PATTERN.findall(stripped.lower())
+            clauses.extend(f'"{token}"*' for token in tokens)
+
+    if phone_filter:
+        digits = re.sub(r"\D", "", phone_filter)
+        if digits:
+            clauses.append(f'phone_digits : "{digits}"*')
+
+    return " AND ".join(clauses) if clauses else None
+
+def build_search_query(
+    match: str,
+    status_filter: Optional[str] = None,
+    source_filter: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Tuple[str, List[Any]]:
+    columns = ", ".join(f"l.{column.strip()}" for column in LEAD_COLUMNS.split(","))
+    query = f"""SELECT {columns} FROM leads_fts
+                JOIN leads l ON l.id = leads_fts.rowid
+                WHERE leads_fts MATCH ?"""
+    params: List[Any] = [match]
+
+    if status_filter:
+        query += " AND l.status = ?"
+        params.append(status_filter)
+
+    if source_filter:
+        query += " AND l.source = ?"
+        params.append(source_filter)
+
+    # Column weights: name and email hits outrank phone and source hits.
+    query += " ORDER BY bm25(leads_fts, 10.0, 5.0, 3.0, 1.0), l.id DESC"
+
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+
+    return query, params
+
+# Clients may cache lead reads but must revalidate them with If-None-Match;
+# a matching ETag costs one index lookup and an empty 304.
+LEAD_CACHE_CONTROL = "no-cache"
+CHANGES_PAGE_SIZE = 1000
+
+def latest_change_seq(conn: sqlite3.Connection, lead_id: Optional[int] = None) -> int:
+    if lead_id is None:
+        row = conn.execute("SELECT MAX(seq) FROM lead_changes").fetchone()
+    else:
+        row = conn.execute("SELECT MAX(seq) FROM lead_changes WHERE lead_id = ?", (lead_id,)).fetchone()
+    return row[0] or 0
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison.
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": LEAD_CACHE_CONTROL}
+    )
+
 @router.get("/", response_model=List[LeadInDB])
 def read_leads(
     status_filter: Optional[str] = Query(None, description="Filter by status"),
     source_filter: Optional[str] = Query(None, description="Filter by source"),
     all_leads: bool = Query(False, description="If true, return all leads ignoring limit and offset"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of results"),
-    offset: int = Query(0, ge=0, description="Number of results to skip")
+    offset: int = Query(0, ge=0, description="Number of results to skip"),
+    before_id: Optional[int] = Query(None, ge=1, description="Keyset cursor: return leads older than this id"),
+    after_id: Optional[int] = Query(None, ge=0, description="Keyset cursor: return leads newer than this id"),
+    q: Optional[str] = Query(None, max_length=200, description="Full-text search over name, email, phone and source"),
+    phone_filter: Optional[str] = Query(None, max_length=50, description="Match leads whose phone digits start with this value"),
+    if_none_match: Optional[str] = Header(None)
 ):
+    if before_id is not None and after_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either before_id or after_id, not both"
+        )
+
+    cursor_mode = before_id is not None or after_id is not None
+    if cursor_mode and offset:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="offset cannot be combined with a keyset cursor"
+        )
+
+    match = build_fts_match(q, phone_filter)
+    if match is not None and cursor_mode:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Keyset cursors cannot be combined with search; use limit and offset"
+        )
+
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        
-        query = "SELECT id, name, email, phone, status, source FROM leads"
-        params = []
-        conditions = []
-        
-        if status_filter:
-            conditions.append("status = ?")
-            params.append(status_filter)
-        
-        if source_filter:
-            conditions.append("source = ?")
-            params.append(source_filter)
-        
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        if not all_leads:
-            query += " ORDER BY id DESC LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+
+        # The list depends only on the leads table, so the latest change seq
+        # identifies it for a given URL. It is read before the query: a change
+        # landing in between only makes the ETag stale, never the body.
+        change_seq = latest_change_seq(conn)
+        etag = f'"{change_seq}"'
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+        if match is not None:
+            query, params = build_search_query(
+                match,
+                status_filter,
+                source_filter,
+                limit=None if all_leads else limit,
+                offset=0 if all_leads else offset,
+            )
         else:
-            query += " ORDER BY id DESC"
-        
+            query, params = build_list_query(
+                status_filter,
+                source_filter,
+                before_id=before_id,
+                after_id=after_id,
+                limit=None if all_leads else limit,
+                offset=0 if all_leads else offset,
+            )
+
         cursor.execute(query, params)
         leads_data = cursor.fetchall()
-        
-        return [LeadInDB(**dict(lead)) for lead in leads_data]
 
-@router.get("/{lead_id}", response_model=LeadInDB)
-def read_lead(lead_id: int):
+    if after_id is not None:
+        leads_data.reverse()
+
+    headers = {"ETag": etag, "Cache-Control": LEAD_CACHE_CONTROL, "X-Change-Seq": str(change_seq)}
+    if not all_leads and leads_data and match is None:
+        if after_id is not None:
+            headers["X-Next-Cursor"] = f"after_id={leads_data[0]['id']}"
+        elif len(leads_data) == limit:
+            headers["X-Next-Cursor"] = f"before_id={leads_data[-1]['id']}"
+
+    return trusted_leads_response(leads_data, headers)
+
+def _export_ndjson(chunks: Iterator[List[sqlite3.Row]]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(json.dumps(dict(row)) + "\n" for row in rows).encode("utf-8")
+
+def _export_csv(chunks: Iterator[List[sqlite3.Row]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_CSV_FIELDS)
+    for rows in chunks:
+        writer.writerows(tuple(row) for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+@router.get("/export")
+def export_leads(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Export format: ndjson or csv"),
+    status_filter: Optional[str] = Query(None, description="Filter by status"),
+    source_filter: Optional[str] = Query(None, description="Filter by source"),
+    chunk_size: int = Query(EXPORT_CHUNK_SIZE, ge=1, le=10000, description="Rows fetched per database round trip")
+):
+    chunks = iter_lead_chunks(status_filter, source_filter, chunk_size)
+    if format == "csv":
+        return StreamingResponse(
+            _export_csv(chunks),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="leads.csv"'}
+        )
+    return StreamingResponse(
+        _export_ndjson(chunks),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="leads.ndjson"'}
+    )
+
+@router.get("/stats", response_model=LeadStats)
+def read_lead_stats():
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, name, email, phone, status, source FROM leads WHERE id = ?", 
-            (lead_id,)
+        rows = conn.execute(
+            "SELECT status, source, count FROM lead_counters WHERE count > 0 ORDER BY status, source"
+        ).fetchall()
+
+    by_status: Dict[str, int] = {}
+    by_source: Dict[str, int] = {}
+    for row in rows:
+        by_status[row["status"]] = by_status.get(row["status"], 0) + row["count"]
+        by_source[row["source"]] = by_source.get(row["source"], 0) + row["count"]
+
+    return LeadStats(
+        total=sum(by_status.values()),
+        by_status=by_status,
+        by_source=by_source,
+        by_status_source=[LeadCounter(**dict(row)) for row in rows]
+    )
+
+@router.get("/changes", response_model=LeadChangesResponse)
+def read_lead_changes(
+    since: int = Query(0, ge=0, description="Return changes after this seq (X-Change-Seq or a previous 'latest')"),
+    limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=5000, description="Maximum number of changed leads")
+):
+    # Each changed lead appears once, at its newest seq, with its current
+    # row; a lead that no longer exists is reported as a delete. Paging by
+    # that seq is gap-free: a lead changed again later moves to a later page.
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            """SELECT c.seq, c.lead_id, l.id, l.name, l.email, l.phone, l.status, l.source,
+                      l.created_at, l.updated_at
+               FROM (
+                   SELECT lead_id, MAX(seq) AS seq FROM lead_changes WHERE seq > ? GROUP BY lead_id
+               ) c
+               LEFT JOIN leads l ON l.id = c.lead_id
+               ORDER BY c.seq
+               LIMIT ?""",
+            (since, limit)
+        ).fetchall()
+        latest = rows[-1]["seq"] if rows else max(since, latest_change_seq(conn))
+
+    changes = []
+    for row in rows:
+        deleted = row["id"] is None
+        lead = None if deleted else trusted_lead(row)
+        changes.append({
+            "seq": row["seq"],
+            "lead_id": row["lead_id"],
+            "operation": "delete" if deleted else "upsert",
+            "lead": lead,
+        })
+
+    return json_response(
+        {"since": since, "latest": latest, "has_more": len(rows) == limit, "changes": changes},
+        {"Cache-Control": LEAD_CACHE_CONTROL}
+    )
+
+def fetch_lead(conn: sqlite3.Connection, lead_id: int) -> LeadInDB:
+    lead_data = conn.execute(
+        "SELECT id, name, email, phone, status, source, created_at, updated_at FROM leads WHERE id = ?",
+        (lead_id,)
+    ).fetchone()
+    if not lead_data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Lead not found"
         )
-        lead_data = cursor.fetchone()
-        
-        if not lead_data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, 
-                detail="Lead not found"
-            )
-        
-        return LeadInDB(**dict(lead_data))
+    return LeadInDB(**dict(lead_data))
+
+def get_lead_with_version(lead_id: int) -> Tuple[LeadInDB, int]:
+    # The change seq versions the lead for the interaction cache: unlike
+    # updated_at it moves on every write, from whichever process made it.
+    with get_db_connection() as conn:
+        return fetch_lead(conn, lead_id), latest_change_seq(conn, lead_id)
+
+@router.get("/{lead_id}", response_model=LeadInDB)
+def read_lead(lead_id: int, response: Response, if_none_match: Optional[str] = Header(None)):
+    with get_db_connection() as conn:
+        etag = f'"{lead_id}.{latest_change_seq(conn, lead_id)}"'
+        # Looked up before the ETag check: a deleted or unknown lead is a
+        # 404 even for "If-None-Match: *" or a stale cached ETag.
+        lead = fetch_lead(conn, lead_id)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = LEAD_CACHE_CONTROL
+    return lead
 
 @router.put("/{lead_id}", response_model=LeadInDB)
+@retry_on_busy
 def update_lead(lead_id: int, lead: LeadUpdate):
     with get_db_connection() as conn:
         cursor = conn.cursor()
@@ -101,6 +403,7 @@ def update_lead(lead_id: int, lead: LeadUpdate):
                 (lead.name, lead.email, lead.phone, lead.status, lead.source, lead_id)
             )
             conn.commit()
+            get_interaction_cache().invalidate_lead(lead_id)
             return LeadInDB(id=lead_id, **lead.dict())
         except sqlite3.IntegrityError:
             raise HTTPException(
@@ -109,11 +412,13 @@ def update_lead(lead_id: int, lead: LeadUpdate):
             )
 
 @router.delete("/{lead_id}", status_code=status.HTTP_204_NO_CONTENT)
+@retry_on_busy
 def delete_lead(lead_id: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM leads WHERE id = ?", (lead_id,))
         conn.commit()
+        get_interaction_cache().invalidate_lead(lead_id)
         
         if cursor.rowcount == 0:
             raise HTTPException(
@@ -122,10 +427,74 @@ def delete_lead(lead_id: int):
             )
 
 @router.get("/{lead_id}/interact")
-async def interact_with_lead(lead_id: int, query: str = Query(..., description="Query for LLM interaction")):
-    lead = read_lead(lead_id)
+async def interact_with_lead(
+    lead_id: int,
+    query: str = Query(..., description="Query for LLM interaction"),
+    no_cache: bool = Query(False, description="Bypass the interaction response cache")
+):
+    lead, version = await run_in_threadpool(get_lead_with_version, lead_id)
     
     from services.llm_service import interact_with_llm
-    response = await interact_with_llm(query, lead)
+    response = await interact_with_llm(query, lead, use_cache=not no_cache, version=version)
     
-    return {"lead_id": lead_id, "query": query, "response": response}
\ No newline at end of file
+    return {"lead_id": lead_id, "query": query, "response": response}
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def _interaction_events(
+    request: Request, query: str, lead: LeadInDB, use_cache: bool, version: Optional[int] = None
+) -> AsyncIterator[str]:
+    from services.llm_service import stream_interaction
+
+    # Each chunk is awaited against the disconnect watcher: if the client goes
+    # away mid-generation the pending LLM call is cancelled straight away
+    # instead of running to completion for nobody.
+    chunks = stream_interaction(query, lead, use_cache=use_cache, version=version)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(request))
+    next_chunk: Optional[asyncio.Future] = None
+    cached = False
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(chunks.__anext__())
+            await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                return
+            try:
+                text, cached = next_chunk.result()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                yield sse_event("error", {"detail": f"LLM interaction failed: {str(e)}"})
+                return
+            yield sse_event("token", {"text": text})
+        yield sse_event("done", {"lead_id": lead.id, "cached": cached})
+    finally:
+        disconnected.cancel()
+        if next_chunk is not None and not next_chunk.done():
+            # Cancelling the pending step unwinds the generator (and the LLM
+            # call inside it) in that task; it cannot be closed from here
+            # while it is still running.
+            next_chunk.cancel()
+        else:
+            await chunks.aclose()
+
+@router.get("/{lead_id}/interact/stream")
+async def stream_interaction_with_lead(
+    request: Request,
+    lead_id: int,
+    query: str = Query(..., description="Query for LLM interaction"),
+    no_cache: bool = Query(False, description="Bypass the interaction response cache")
+):
+    lead, version = await run_in_threadpool(get_lead_with_version, lead_id)
+    return StreamingResponse(
+        _interaction_events(request, query, lead, use_cache=not no_cache, version=version),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
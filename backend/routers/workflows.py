@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from typing import Optional
+import logging
+import smtplib
+
+from database.models import OutboxDrainResponse, WorkflowRunRequest, WorkflowRunResponse
+from services.workflow_service import drain_outbox, run_workflow
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/workflows", tags=["workflows"])
+
+@router.post("/run", response_model=WorkflowRunResponse)
+async def run_workflow_endpoint(request: WorkflowRunRequest):
+    return await run_workflow(request)
+
+@router.post("/outbox/drain", response_model=OutboxDrainResponse)
+def drain_outbox_endpoint(
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of emails to send")
+):
+    try:
+        return drain_outbox(limit)
+    except (smtplib.SMTPException, OSError) as e:
+        logger.error("Mail backend unavailable: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Mail backend unavailable: {e}"
+        )
@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from database.pool import ConnectionPool
+
+CACHE_FILE = os.getenv("CRM_CACHE_FILE", "./cache.db")
+CACHE_ENABLED = os.getenv("CRM_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+CACHE_MAX_ENTRIES = int(os.getenv("CRM_CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("CRM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("CRM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+INTERACTION_CACHE_MAX_ENTRIES = int(os.getenv("CRM_INTERACTION_CACHE_MAX_ENTRIES", "2048"))
+
+# Touching accessed_at on every hit would turn reads into writes; entries
+# only need LRU precision on the order of this window.
+ACCESS_TOUCH_INTERVAL = 60.0
+
+def content_hash(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+class ContentCache:
+    def __init__(
+        self,
+        database: str = CACHE_FILE,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        enabled: bool = CACHE_ENABLED,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._pool = ConnectionPool(database, max_size=4)
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        )
+        self._counter_lock = threading.Lock()
+        self._create_table()
+
+    def _create_table(self) -> None:
+        with self._pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    expires_at REAL,
+                    PRIMARY KEY (namespace, key)
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries(accessed_at)
+            ''')
+            conn.commit()
+
+    def _count(self, namespace: str, counter: str, amount: int = 1) -> None:
+        with self._counter_lock:
+            self._counters[namespace][counter] += amount
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT value, accessed_at, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+            if row is None:
+                self._count(namespace, "misses")
+                return None
+            if row["expires_at"] is not None and row["expires_at"] <= now:
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key)
+                )
+                conn.commit()
+                self._count(namespace, "misses")
+                return None
+            if now - row["accessed_at"] > ACCESS_TOUCH_INTERVAL:
+                conn.execute(
+                    "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, namespace, key)
+                )
+                conn.commit()
+        self._count(namespace, "hits")
+        return row["value"]
+
+    def put(self, namespace: str, key: str, value: str, ttl_seconds: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = now + ttl if ttl and ttl > 0 else None
+        with self._pool.connection() as conn:
+            conn.execute(
+                """INSERT INTO cache_entries (namespace, key, value, size, created_at, accessed_at, expires_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(namespace, key) DO UPDATE SET
+                       value = excluded.value, size = excluded.size, created_at = excluded.created_at,
+                       accessed_at = excluded.accessed_at, expires_at = excluded.expires_at""",
+                (namespace, key, value, len(value.encode("utf-8")), now, now, expires_at)
+            )
+            self._evict(conn, now)
+            conn.commit()
+        self._count(namespace, "writes")
+
+    def _evict(self, conn, now: float) -> None:
+        expired = conn.execute(
+            "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount
+        if expired:
+            self._count("_all", "evictions", expired)
+
+        entries, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+        ).fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        evicted = 0
+        rows = conn.execute(
+            "SELECT namespace, key, size FROM cache_entries ORDER BY accessed_at ASC"
+        )
+        victims = []
+        for namespace, key, size in rows:
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            victims.append((namespace, key))
+            entries -= 1
+            total_bytes -= size
+            evicted += 1
+        conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+        self._count("_all", "evictions", evicted)
+
+    async def aget(self, namespace: str, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self.get, namespace, key)
+
+    async def aput(self, namespace: str, key: str, value: str, ttl_seconds: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self.put, namespace, key, value, ttl_seconds)
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        with self._pool.connection() as conn:
+            if namespace is None:
+                conn.execute("DELETE FROM cache_entries")
+            else:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+            conn.commit()
+
+    def stats(self) -> Dict[str, object]:
+        with self._pool.connection() as conn:
+            entries, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+            ).fetchone()
+        with self._counter_lock:
+            counters = {namespace: dict(values) for namespace, values in self._counters.items()}
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "namespaces": counters,
+        }
+
+    def close(self) -> None:
+        self._pool.close()
+
+class InteractionCache:
+    def __init__(self, max_entries: int = INTERACTION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._keys_by_lead: Dict[int, Set[Tuple]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def make_key(lead_id: int, version: object, intent: str, query: str) -> Tuple:
+        return (lead_id, str(version), intent, " ".join(query.lower().split()))
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: Tuple, value: str) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._keys_by_lead[key[0]].add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._discard_index(evicted)
+                self._evictions += 1
+
+    def _discard_index(self, key: Tuple) -> None:
+        keys = self._keys_by_lead.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_lead[key[0]]
+
+    def invalidate_lead(self, lead_id: int) -> None:
+        with self._lock:
+            for key in self._keys_by_lead.pop(lead_id, ()):
+                self._entries.pop(key, None)
+                self._invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_lead.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+
+_content_cache: Optional[ContentCache] = None
+_content_cache_lock = threading.Lock()
+
+def get_content_cache() -> ContentCache:
+    global _content_cache
+    if _content_cache is None:
+        with _content_cache_lock:
+            if _content_cache is None:
+                _content_cache = ContentCache()
+    return _content_cache
+
+def close_content_cache() -> None:
+    global _content_cache
+    with _content_cache_lock:
+        if _content_cache is not None:
+            _content_cache.close()
+            _content_cache = None
+
+
+_interaction_cache = InteractionCache()
+
+def get_interaction_cache() -> InteractionCache:
+    return _interaction_cache
@@ -0,0 +1,494 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from database.database import get_db_connection, retry_on_busy
+from database.migrations import email_normalized_sql, phone_normalized_sql
+from database.models import DedupeRun, DuplicateGroup, LeadDedupeResponse
+from services.cache_service import get_interaction_cache
+
+logger = logging.getLogger(__name__)
+
+DEDUP_THRESHOLD = float(os.getenv("CRM_DEDUP_THRESHOLD", "0.8"))
+# Blocks larger than this are shared placeholders ("info@", a switchboard
+# number) rather than one person, and would cost O(n^2) pairs to score.
+DEDUP_MAX_BLOCK = int(os.getenv("CRM_DEDUP_MAX_BLOCK", "200"))
+DEDUP_WORKERS = int(os.getenv("CRM_DEDUP_WORKERS", str(os.cpu_count() or 1)))
+DEDUP_PAIRS_PER_TASK = int(os.getenv("CRM_DEDUP_PAIRS_PER_TASK", "50000"))
+DEDUP_MERGE_BATCH = 500
+DEDUP_HEARTBEAT_SECONDS = float(os.getenv("CRM_DEDUP_HEARTBEAT_SECONDS", "10"))
+# A running run without a heartbeat for this long belongs to a dead process.
+DEDUP_STALE_SECONDS = float(os.getenv("CRM_DEDUP_STALE_SECONDS", "300"))
+DEDUP_STOP_TIMEOUT_SECONDS = 10
+DEDUP_MAX_REPORTED_GROUPS = 1000
+
+NAME_TOKEN_PATTERN = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+# (id, name, email_normalized, phone_normalized)
+Candidate = Tuple[int, str, Optional[str], Optional[str]]
+ContactKeys = Tuple[Optional[str], Optional[str]]
+
+class DuplicateMatch(NamedTuple):
+    score: float
+    lead_id: Optional[int] = None
+    batch_index: Optional[int] = None
+    name: Optional[str] = None
+    email: Optional[str] = None
+
+def normalize_name(name: Optional[str]) -> str:
+    # Token sort, so "Smith, John" and "john smith" compare as equal.
+    return " ".join(sorted(NAME_TOKEN_PATTERN.findall((name or "").lower())))
+
+def name_similarity(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+def match_score(email_match: bool, phone_match: bool, similarity: float) -> float:
+    if email_match and phone_match:
+        return 1.0
+    if email_match:
+        # The same mailbox under another alias is strong evidence on its own.
+        return 0.5 + 0.5 * similarity
+    if phone_match:
+        # Phones are shared by offices and households; the name has to agree.
+        return 0.9 * similarity
+    return 0.0
+
+def contact_keys(conn: sqlite3.Connection, contacts: Sequence[Tuple[str, Optional[str]]]) -> List[ContactKeys]:
+    # Normalized by the same SQL expressions as the generated columns, so
+    # probe keys can never drift from the indexed ones.
+    rows = conn.execute(
+        f"""SELECT {email_normalized_sql("value ->> 0")}, {phone_normalized_sql("value ->> 1")}
+            FROM json_each(?) ORDER BY key""",
+        (json.dumps(list(contacts)),)
+    ).fetchall()
+    return [(row[0], row[1]) for row in rows]
+
+def find_likely_duplicates(
+    conn: sqlite3.Connection,
+    leads: Sequence[Tuple[str, str, Optional[str]]],
+    threshold: float = DEDUP_THRESHOLD,
+) -> List[Optional[DuplicateMatch]]:
+    # On-insert check for (name, email, phone) candidates: each one is
+    # compared with the leads sharing its blocking keys and with the earlier
+    # candidates of the same batch. Exact email matches are left to the
+    # unique constraint, which already reports them.
+    if not leads:
+        return []
+    keys = contact_keys(conn, [(email, phone) for _, email, phone in leads])
+    email_keys = sorted({email_key for email_key, _ in keys if email_key})
+    phone_keys = sorted({phone_key for _, phone_key in keys if phone_key})
+    rows = conn.execute(
+        """SELECT id, name, email, email_normalized, phone_normalized FROM leads
+           WHERE email_normalized IN (SELECT value FROM json_each(?))
+           UNION
+           SELECT id, name, email, email_normalized, phone_normalized FROM leads
+           WHERE phone_normalized IN (SELECT value FROM json_each(?))""",
+        (json.dumps(email_keys), json.dumps(phone_keys))
+    ).fetchall()
+
+    # Existing leads and accepted batch rows, both indexed by blocking key.
+    by_email: Dict[str, List[Tuple[DuplicateMatch, str, Optional[str]]]] = {}
+    by_phone: Dict[str, List[Tuple[DuplicateMatch, str, Optional[str]]]] = {}
+
+    def remember(match: DuplicateMatch, email_key: Optional[str], phone_key: Optional[str]) -> None:
+        entry = (match, email_key, phone_key)
+        if email_key:
+            by_email.setdefault(email_key, []).append(entry)
+        if phone_key:
+            by_phone.setdefault(phone_key, []).append(entry)
+
+    for row in rows:
+        remember(
+            DuplicateMatch(0.0, lead_id=row["id"], name=row["name"], email=row["email"]),
+            row["email_normalized"],
+            row["phone_normalized"],
+        )
+
+    taken = {row["email"] for row in rows}
+    matches: List[Optional[DuplicateMatch]] = []
+    for index, ((name, email, _), (email_key, phone_key)) in enumerate(zip(leads, keys)):
+        if email in taken:
+            matches.append(None)
+            continue
+        normalized = normalize_name(name)
+        best: Optional[DuplicateMatch] = None
+        seen = set()
+        for entry in by_email.get(email_key, []) + by_phone.get(phone_key, []):
+            other, other_email_key, other_phone_key = entry
+            if id(entry) in seen or other.email == email:
+                continue
+            seen.add(id(entry))
+            score = match_score(
+                email_key is not None and email_key == other_email_key,
+                phone_key is not None and phone_key == other_phone_key,
+                name_similarity(normalized, normalize_name(other.name)),
+            )
+            if score >= threshold and (best is None or score > best.score):
+                best = other._replace(score=round(score, 3))
+        matches.append(best)
+        if best is None:
+            remember(DuplicateMatch(0.0, batch_index=index, name=name, email=email), email_key, phone_key)
+    return matches
+
+def describe_match(match: DuplicateMatch) -> str:
+    if match.lead_id is not None:
+        return f"Likely duplicate of lead #{match.lead_id} ({match.name}, {match.email})"
+    return f"Likely duplicate of row {match.batch_index} in this batch ({match.name}, {match.email})"
+
+def _fetch_blocks(conn: sqlite3.Connection, column: str, max_block: int) -> Tuple[List[List[int]], int]:
+    # Walks the key's index in order, so grouping the whole table never
+    # touches the rows themselves.
+    blocks: List[List[int]] = []
+    skipped = 0
+    for row in conn.execute(
+        f"""SELECT json_group_array(id) AS ids, COUNT(*) AS size FROM leads
+            WHERE {column} IS NOT NULL GROUP BY {column} HAVING COUNT(*) > 1"""
+    ):
+        if row["size"] > max_block:
+            skipped += 1
+            continue
+        blocks.append(json.loads(row["ids"]))
+    return blocks, skipped
+
+def _fetch_candidates(conn: sqlite3.Connection, ids: Sequence[int]) -> Dict[int, Candidate]:
+    candidates: Dict[int, Candidate] = {}
+    for start in range(0, len(ids), 10000):
+        rows = conn.execute(
+            """SELECT id, name, email_normalized, phone_normalized FROM leads
+               WHERE id IN (SELECT value FROM json_each(?))""",
+            (json.dumps(list(ids[start:start + 10000])),)
+        ).fetchall()
+        candidates.update((row[0], (row[0], row[1], row[2], row[3])) for row in rows)
+    return candidates
+
+def score_blocks(blocks: Sequence[Sequence[Candidate]], threshold: float) -> List[Tuple[int, int, float]]:
+    # Runs in worker processes: plain tuples in, plain tuples out.
+    pairs: List[Tuple[int, int, float]] = []
+    for block in blocks:
+        members = [(lead_id, normalize_name(name), email_key, phone_key) for lead_id, name, email_key, phone_key in block]
+        for i, (id_a, name_a, email_a, phone_a) in enumerate(members):
+            for id_b, name_b, email_b, phone_b in members[i + 1:]:
+                score = match_score(
+                    email_a is not None and email_a == email_b,
+                    phone_a is not None and phone_a == phone_b,
+                    name_similarity(name_a, name_b),
+                )
+                if score >= threshold:
+                    pairs.append((min(id_a, id_b), max(id_a, id_b), score))
+    return pairs
+
+def _batch_blocks(blocks: Sequence[Sequence[Candidate]], pairs_per_task: int) -> Iterator[List[Sequence[Candidate]]]:
+    batch: List[Sequence[Candidate]] = []
+    pairs = 0
+    for block in blocks:
+        batch.append(block)
+        pairs += len(block) * (len(block) - 1) // 2
+        if pairs >= pairs_per_task:
+            yield batch
+            batch, pairs = [], 0
+    if batch:
+        yield batch
+
+def cluster_pairs(pairs: Sequence[Tuple[int, int, float]]) -> List[DuplicateGroup]:
+    parent: Dict[int, int] = {}
+
+    def find(lead_id: int) -> int:
+        root = parent.setdefault(lead_id, lead_id)
+        while root != parent[root]:
+            root = parent[root]
+        while parent[lead_id] != root:
+            parent[lead_id], lead_id = root, parent[lead_id]
+        return root
+
+    for id_a, id_b, _ in pairs:
+        root_a, root_b = find(id_a), find(id_b)
+        if root_a != root_b:
+            # The oldest lead is the root, so it ends up as the primary.
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    members: Dict[int, List[int]] = {}
+    weakest: Dict[int, float] = {}
+    for lead_id in parent:
+        members.setdefault(find(lead_id), []).append(lead_id)
+    for id_a, _, score in pairs:
+        root = find(id_a)
+        weakest[root] = min(weakest.get(root, 1.0), score)
+    return [
+        DuplicateGroup(primary_id=root, duplicate_ids=sorted(ids)[1:], score=round(weakest[root], 3))
+        for root, ids in sorted(members.items())
+    ]
+
+@retry_on_busy
+def merge_duplicate_groups(groups: Sequence[DuplicateGroup]) -> int:
+    # The primary keeps its own fields and only inherits a phone it lacks;
+    # outbox history follows the merged leads to the primary.
+    merged = 0
+    with get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for group in groups:
+                duplicates = json.dumps(group.duplicate_ids)
+                conn.execute(
+                    """UPDATE leads SET phone = (
+                           SELECT phone FROM leads WHERE id IN (SELECT value FROM json_each(?))
+                           AND phone IS NOT NULL AND phone != '' ORDER BY id LIMIT 1
+                       )
+                       WHERE id = ? AND (phone IS NULL OR phone = '')
+                       AND EXISTS (SELECT 1 FROM leads WHERE id IN (SELECT value FROM json_each(?))
+                                   AND phone IS NOT NULL AND phone != '')""",
+                    (duplicates, group.primary_id, duplicates)
+                )
+                conn.execute(
+                    "UPDATE workflow_outbox SET lead_id = ? WHERE lead_id IN (SELECT value FROM json_each(?))",
+                    (group.primary_id, duplicates)
+                )
+                cursor = conn.execute(
+                    "DELETE FROM leads WHERE id IN (SELECT value FROM json_each(?))", (duplicates,)
+                )
+                merged += cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    cache = get_interaction_cache()
+    for group in groups:
+        for lead_id in [group.primary_id, *group.duplicate_ids]:
+            cache.invalidate_lead(lead_id)
+    return merged
+
+@retry_on_busy
+def _start_run(run_id: str, owner: str, merge: bool, threshold: float) -> bool:
+    # One run at a time across all server processes. A run whose owner
+    # stopped heartbeating (process killed) no longer blocks new ones.
+    with get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            """UPDATE dedupe_runs SET status = 'failed', error = 'Interrupted', updated_at = CURRENT_TIMESTAMP
+               WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)""",
+            (time.time() - DEDUP_STALE_SECONDS,)
+        )
+        if conn.execute("SELECT 1 FROM dedupe_runs WHERE status = 'running' LIMIT 1").fetchone():
+            conn.commit()
+            return False
+        conn.execute(
+            """INSERT INTO dedupe_runs (id, status, stage, merge, threshold, owner, heartbeat_at)
+               VALUES (?, 'running', 'blocking', ?, ?, ?, ?)""",
+            (run_id, int(merge), threshold, owner, time.time())
+        )
+        conn.commit()
+        return True
+
+@retry_on_busy
+def _update_run(run_id: str, owner: str, **fields: Any) -> bool:
+    # Only the owner of a run that is still running may touch it.
+    assignments = "".join(f"{column} = ?, " for column in fields)
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            f"""UPDATE dedupe_runs SET {assignments}heartbeat_at = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND owner = ? AND status = 'running'""",
+            (*fields.values(), time.time(), run_id, owner)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+
+@retry_on_busy
+def _abandon_runs(owner: str) -> int:
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            """UPDATE dedupe_runs SET status = 'failed', error = 'Interrupted by shutdown',
+                   updated_at = CURRENT_TIMESTAMP
+               WHERE owner = ? AND status = 'running'""",
+            (owner,)
+        )
+        conn.commit()
+        return cursor.rowcount
+
+def get_dedupe_run(run_id: str) -> Optional[DedupeRun]:
+    with get_db_connection() as conn:
+        row = conn.execute("SELECT * FROM dedupe_runs WHERE id = ?", (run_id,)).fetchone()
+    if row is None:
+        return None
+    return DedupeRun(
+        id=row["id"],
+        status=row["status"],
+        stage=row["stage"],
+        merge=bool(row["merge"]),
+        threshold=row["threshold"],
+        result=LeadDedupeResponse(**json.loads(row["result"])) if row["result"] else None,
+        error=row["error"],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"]
+    )
+
+class DedupeCancelled(Exception):
+    pass
+
+class DedupeRunner:
+    def __init__(self, max_workers: int = DEDUP_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _reset_executor(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def score(
+        self, blocks: Sequence[Sequence[Candidate]], threshold: float, progress: Optional[Callable[[], None]] = None
+    ) -> List[Tuple[int, int, float]]:
+        tasks = list(_batch_blocks(blocks, DEDUP_PAIRS_PER_TASK))
+        if self.max_workers <= 1 or len(tasks) <= 1:
+            results: Iterator[List[Tuple[int, int, float]]] = (score_blocks(task, threshold) for task in tasks)
+            executor = None
+        else:
+            executor = self._get_executor()
+            results = executor.map(score_blocks, tasks, [threshold] * len(tasks))
+        pairs: List[Tuple[int, int, float]] = []
+        try:
+            for task_pairs in results:
+                pairs.extend(task_pairs)
+                if progress is not None:
+                    progress()
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            raise
+        return pairs
+
+    def run(
+        self,
+        merge: bool = False,
+        threshold: float = DEDUP_THRESHOLD,
+        max_block: int = DEDUP_MAX_BLOCK,
+        progress: Optional[Callable[[str], None]] = None,
+    ) -> LeadDedupeResponse:
+        report = progress or (lambda stage: None)
+        started = time.perf_counter()
+        report("blocking")
+        with get_db_connection() as conn:
+            email_blocks, skipped_email = _fetch_blocks(conn, "email_normalized", max_block)
+            phone_blocks, skipped_phone = _fetch_blocks(conn, "phone_normalized", max_block)
+            id_blocks = email_blocks + phone_blocks
+            candidates = _fetch_candidates(conn, sorted({lead_id for block in id_blocks for lead_id in block}))
+
+        blocks = [[candidates[lead_id] for lead_id in block if lead_id in candidates] for block in id_blocks]
+        report("scoring")
+        # A pair sharing both keys shows up in two blocks with the same score.
+        pairs = sorted(set(self.score(blocks, threshold, lambda: report("scoring"))))
+        groups = cluster_pairs(pairs)
+
+        merged = 0
+        if merge:
+            for start in range(0, len(groups), DEDUP_MERGE_BATCH):
+                report("merging")
+                merged += merge_duplicate_groups(groups[start:start + DEDUP_MERGE_BATCH])
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            "Dedupe scored %d blocks, found %d groups and merged %d leads in %.1fs",
+            len(blocks), len(groups), merged, elapsed
+        )
+        return LeadDedupeResponse(
+            blocks=len(blocks),
+            skipped_blocks=skipped_email + skipped_phone,
+            candidate_pairs=sum(len(block) * (len(block) - 1) // 2 for block in blocks),
+            duplicate_groups=len(groups),
+            duplicates=sum(len(group.duplicate_ids) for group in groups),
+            merged=merged,
+            groups=groups[:DEDUP_MAX_REPORTED_GROUPS],
+            groups_truncated=len(groups) > DEDUP_MAX_REPORTED_GROUPS,
+            elapsed_seconds=round(elapsed, 3),
+        )
+
+    async def submit(self, merge: bool, threshold: float) -> Optional[str]:
+        run_id = uuid.uuid4().hex
+        if not await asyncio.to_thread(_start_run, run_id, self.owner, merge, threshold):
+            return None
+        task = asyncio.create_task(asyncio.to_thread(self._execute, run_id, merge, threshold))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return run_id
+
+    def _execute(self, run_id: str, merge: bool, threshold: float) -> None:
+        last_beat = time.monotonic()
+
+        def progress(stage: str) -> None:
+            nonlocal last_beat
+            if self._stopping.is_set():
+                raise DedupeCancelled()
+            if time.monotonic() - last_beat >= DEDUP_HEARTBEAT_SECONDS:
+                last_beat = time.monotonic()
+                if not _update_run(run_id, self.owner, stage=stage):
+                    # Declared stale by another process; stop rather than
+                    # race a newer run.
+                    raise DedupeCancelled()
+
+        try:
+            result = self.run(merge=merge, threshold=threshold, progress=progress)
+        except DedupeCancelled:
+            logger.warning("Dedupe run %s was interrupted", run_id)
+            return
+        except Exception as e:
+            logger.exception("Dedupe run %s failed", run_id)
+            _update_run(run_id, self.owner, status="failed", stage="failed", error=str(e))
+            return
+        _update_run(run_id, self.owner, status="completed", stage="done", result=json.dumps(result.dict()))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        self.shutdown()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=DEDUP_STOP_TIMEOUT_SECONDS)
+        abandoned = await asyncio.to_thread(_abandon_runs, self.owner)
+        if abandoned:
+            logger.info("Marked %d interrupted dedupe runs as failed", abandoned)
+
+_runner: Optional[DedupeRunner] = None
+
+def get_dedupe_runner() -> DedupeRunner:
+    global _runner
+    if _runner is None:
+        _runner = DedupeRunner()
+    return _runner
+
+async def stop_dedupe_runner() -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.stop()
+        _runner = None
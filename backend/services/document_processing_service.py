@@ -1,17 +1,23 @@
-from typing import Dict, Any, List
-import os
-import tempfile
-import asyncio
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Set, Tuple, Union
 from pathlib import Path
+import asyncio
+import codecs
+import hashlib
+import os
+import re
 
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
-from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
-from langchain.chat_models import init_chat_model
 from dotenv import load_dotenv
 
+from database.database import get_db_connection
+from database.leads import find_existing_emails
 from database.models import LeadCreate
+from services.cache_service import content_hash, get_content_cache
+from services.llm_runtime import get_llm_runtime, register_chain
+from services.metrics_service import DOCUMENT_STAGE_LATENCY, registry, span
+from services.text_extraction_service import get_pdf_engine
+from services.upload_service import file_sha256
 
 load_dotenv()
 
@@ -44,78 +50,350 @@ Format Instructions:
 {format_instructions}
 """
 
+LLM_CHUNK_SIZE = int(os.getenv("CRM_LLM_CHUNK_SIZE", "4000"))
+LLM_CHUNK_OVERLAP = int(os.getenv("CRM_LLM_CHUNK_OVERLAP", "400"))
+LLM_MAX_CONCURRENCY = int(os.getenv("CRM_LLM_MAX_CONCURRENCY", "4"))
+MAX_DOCUMENT_CHARS = int(os.getenv("CRM_MAX_DOCUMENT_CHARS", "400000"))
+
+PRE_EXTRACTION_ENABLED = os.getenv("CRM_PRE_EXTRACTION_ENABLED", "true").lower() in ("1", "true", "yes")
+PRE_EXTRACTION_CONTEXT_LINES = int(os.getenv("CRM_PRE_EXTRACTION_CONTEXT_LINES", "2"))
+
+TEXT_CACHE_NAMESPACE = "extracted_text"
+LLM_LEADS_CACHE_NAMESPACE = "llm_leads"
+
+register_chain(
+    "lead_extraction",
+    LEAD_EXTRACTION_PROMPT,
+    parser_factory=lambda: JsonOutputParser(pydantic_object=ExtractedLeadsData)
+)
+
 class DocumentProcessingError(Exception):
     pass
 
-async def extract_text_from_file(file_content: bytes, file_extension: str) -> str:
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}")
+# Only the characters LeadBase accepts in a phone, so a pre-extracted phone
+# never fails validation later; dotted or annotated numbers go to the LLM.
+PHONE_CANDIDATE_PATTERN = re.compile(r"\+?\(?\d[\d \t\-()]{5,}\d")
+CELL_SEPARATOR_PATTERN = re.compile(r"\s*(?:[\t,;|]|\s{2,})\s*")
+FIELD_LABEL_PATTERN = re.compile(
+    r"\b(?:full name|name|contact|e-?mail|phone|tel|telephone|mobile|cell)\s*[:=]\s*", re.IGNORECASE
+)
+NAME_TOKEN_PATTERN = re.compile(r"^[^\W\d_](?:[^\W\d_]|['’.\-])*$")
+# Header labels and words that mark a shared mailbox or an organisation
+# rather than a person; such lines are left for the LLM to judge.
+NON_NAME_WORDS = frozenset({
+    "name", "email", "e-mail", "phone", "mobile", "tel", "telephone", "contact", "status", "source",
+    "company", "team", "sales", "support", "info", "office", "department", "dept", "group", "admin",
+    "corp", "inc", "ltd", "llc", "gmbh",
+})
+
+PRE_EXTRACTED_LINES = registry.counter(
+    "crm_document_pre_extracted_lines_total",
+    "Contact lines seen by local pre-extraction, by how they were resolved", ("outcome",)
+)
+
+class PreExtraction:
+    def __init__(self, lines: List[str]):
+        self.lines = lines
+        self.leads: List[ExtractedLead] = []
+        self.ambiguous: List[Tuple[int, List[str]]] = []
+
+    @property
+    def emails(self) -> List[str]:
+        found = [lead.email for lead in self.leads]
+        for _, emails in self.ambiguous:
+            found.extend(emails)
+        return found
+
+def _looks_like_name(text: str) -> bool:
+    tokens = text.split()
+    return (
+        2 <= len(tokens) <= 5
+        and all(NAME_TOKEN_PATTERN.match(token) for token in tokens)
+        and not any(token.lower().strip(".:") in NON_NAME_WORDS for token in tokens)
+    )
+
+def parse_contact_line(line: str) -> Optional[ExtractedLead]:
+    # A line is resolved locally only when it holds exactly one email, at
+    # most one phone and exactly one other cell that reads as a full name;
+    # anything else (extra columns, several people, labels split across
+    # lines) is left for the LLM.
+    emails = EMAIL_PATTERN.findall(line)
+    if len(emails) != 1:
+        return None
+    email = emails[0]
+    rest = FIELD_LABEL_PATTERN.sub(" ", line.replace(email, " ", 1))
+
+    phones = [
+        match for match in PHONE_CANDIDATE_PATTERN.finditer(rest)
+        if sum(char.isdigit() for char in match.group(0)) >= 7
+    ]
+    if len(phones) > 1:
+        return None
+    phone = "N/A"
+    if phones:
+        phone = phones[0].group(0).strip()
+        rest = rest[:phones[0].start()] + " " + rest[phones[0].end():]
+
+    cells = [cell for cell in CELL_SEPARATOR_PATTERN.split(rest.strip(" \t,;|")) if cell.strip()]
+    if len(cells) != 1 or not _looks_like_name(cells[0]):
+        return None
+    return ExtractedLead(name=" ".join(cells[0].split()), email=email, phone=phone, status="New", source="Document")
+
+def pre_extract_leads(raw_text: str) -> PreExtraction:
+    result = PreExtraction(raw_text.splitlines())
+    for index, line in enumerate(result.lines):
+        if "@" not in line:
+            continue
+        lead = parse_contact_line(line)
+        if lead is not None:
+            result.leads.append(lead)
+            continue
+        emails = EMAIL_PATTERN.findall(line)
+        if emails:
+            result.ambiguous.append((index, emails))
+    return result
+
+def build_snippets(lines: List[str], line_numbers: List[int], context: int = PRE_EXTRACTION_CONTEXT_LINES) -> str:
+    # Neighbouring lines go along because names and phones in free-form
+    # layouts often sit a line or two away from the email; overlapping
+    # windows are merged so no line is sent twice.
+    windows: List[List[int]] = []
+    for number in sorted(line_numbers):
+        start, end = max(0, number - context), min(len(lines), number + context + 1)
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+    return "\n\n".join("\n".join(lines[start:end]) for start, end in windows)
+
+# Documents arrive either as bytes or as the path of a spooled upload.
+DocumentSource = Union[bytes, Path]
+
+def decode_text(data: bytes, truncated: bool = False) -> str:
+    try:
+        # A truncated read may end inside a multi-byte character; the
+        # incremental decoder drops that tail instead of failing on it.
+        return codecs.getincrementaldecoder('utf-8')().decode(data, final=not truncated)
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+def _read_text_file(path: Path, max_chars: Optional[int]) -> str:
+    with open(path, "rb") as handle:
+        if max_chars is None:
+            return decode_text(handle.read())
+        # UTF-8 needs at most four bytes per character.
+        data = handle.read(max_chars * 4 + 1)
+    return decode_text(data[:max_chars * 4], truncated=len(data) > max_chars * 4)[:max_chars]
+
+async def extract_text_from_file(
+    file_content: DocumentSource, file_extension: str, max_chars: Optional[int] = None
+) -> str:
     if file_extension == ".pdf":
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(file_content)
-            tmp_file_path = tmp_file.name
-        
-        try:
-            loader = PyPDFLoader(tmp_file_path)
-            documents = await asyncio.get_event_loop().run_in_executor(
-                None, loader.load
-            )
-            text = "\n".join([doc.page_content for doc in documents])
-            return text
-        finally:
-            Path(tmp_file_path).unlink(missing_ok=True)
-            
+        return await get_pdf_engine().extract(file_content, max_chars=max_chars)
     elif file_extension == ".txt":
-        try:
-            return file_content.decode('utf-8')
-        except UnicodeDecodeError:
-            return file_content.decode('latin-1')
+        if isinstance(file_content, Path):
+            return await asyncio.to_thread(_read_text_file, file_content, max_chars)
+        text = decode_text(file_content)
+        return text if max_chars is None else text[:max_chars]
     else:
         raise DocumentProcessingError(f"Unsupported file type: {file_extension}")
 
-async def extract_lead_data_with_llm(raw_text: str) -> List[ExtractedLead]:
+async def document_digest(file_content: DocumentSource) -> str:
+    if isinstance(file_content, Path):
+        return await asyncio.to_thread(file_sha256, file_content)
+    return hashlib.sha256(file_content).hexdigest()
+
+def split_text_into_chunks(
+    text: str, chunk_size: int = LLM_CHUNK_SIZE, overlap: int = LLM_CHUNK_OVERLAP
+) -> List[str]:
+    # Chunks break on line boundaries so a contact row is never cut in half;
+    # the overlap repeats trailing lines so rows that straddle a boundary are
+    # seen whole by at least one chunk. Duplicates are merged afterwards.
+    lines: List[str] = []
+    for line in text.splitlines(keepends=True):
+        while len(line) > chunk_size:
+            lines.append(line[:chunk_size])
+            line = line[chunk_size:]
+        lines.append(line)
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_size = 0
+    for line in lines:
+        if current and current_size + len(line) > chunk_size:
+            chunks.append("".join(current))
+            carried: List[str] = []
+            carried_size = 0
+            for previous in reversed(current):
+                if carried_size + len(previous) > overlap:
+                    break
+                carried.insert(0, previous)
+                carried_size += len(previous)
+            current, current_size = carried, carried_size
+        current.append(line)
+        current_size += len(line)
+
+    if current and "".join(current).strip():
+        chunks.append("".join(current))
+    return chunks
+
+def merge_extracted_leads(batches: List[List[ExtractedLead]]) -> List[ExtractedLead]:
+    merged: Dict[str, ExtractedLead] = {}
+    for leads in batches:
+        for lead in leads:
+            key = lead.email.strip().lower()
+            if not key:
+                continue
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = lead
+                continue
+            # Overlapping chunks can see the same person with a truncated name
+            # or a missing phone; keep the most complete version.
+            if existing.phone in ("", "N/A") and lead.phone not in ("", "N/A"):
+                existing.phone = lead.phone
+            if len(lead.name.strip()) > len(existing.name.strip()):
+                existing.name = lead.name
+    return list(merged.values())
+
+async def extract_lead_data_with_llm(raw_text: str, use_cache: bool = True) -> List[ExtractedLead]:
     if not raw_text.strip():
         raise DocumentProcessingError("No text content found in document")
+
+    try:
+        runtime = get_llm_runtime()
+    except Exception as e:
+        raise DocumentProcessingError(f"LLM runtime unavailable: {str(e)}")
+
+    cache = get_content_cache()
+    cache_key = content_hash(
+        raw_text, LEAD_EXTRACTION_PROMPT, runtime.model_name, f"{LLM_CHUNK_SIZE}:{LLM_CHUNK_OVERLAP}"
+    )
+
+    if use_cache:
+        cached = await cache.aget(LLM_LEADS_CACHE_NAMESPACE, cache_key)
+        if cached is not None:
+            return ExtractedLeadsData.parse_raw(cached).leads
     
     try:
-        llm = init_chat_model(
-            model_provider="groq", 
-            model="llama-3.3-70b-versatile", 
-            temperature=0
+        inputs = [{"text": chunk} for chunk in split_text_into_chunks(raw_text)]
+        outputs = await runtime.abatch(
+            "lead_extraction",
+            inputs,
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            return_exceptions=True
         )
-        
-        parser = JsonOutputParser(pydantic_object=ExtractedLeadsData)
-        
-        prompt = ChatPromptTemplate.from_template(LEAD_EXTRACTION_PROMPT)
-        chain = prompt | llm | parser
-        
-        extracted_data_dict = await chain.ainvoke({
-            "text": raw_text[:4000],
-            "format_instructions": parser.get_format_instructions()
-        })
-        
-        return [ExtractedLead(**lead_dict) for lead_dict in extracted_data_dict.get("leads", [])]
+
+        with span(DOCUMENT_STAGE_LATENCY, "merge_leads", stage="merge_leads"):
+            batches = []
+            for output in outputs:
+                if isinstance(output, Exception):
+                    raise output
+                batches.append([ExtractedLead(**lead_dict) for lead_dict in output.get("leads", [])])
+
+            leads = merge_extracted_leads(batches)
     
     except Exception as e:
         raise DocumentProcessingError(f"LLM processing failed: {str(e)}")
 
-async def process_document_for_lead(file_content: bytes, file_extension: str) -> tuple[List[LeadCreate], int]:
+    await cache.aput(LLM_LEADS_CACHE_NAMESPACE, cache_key, ExtractedLeadsData(leads=leads).json())
+    return leads
+
+async def extract_leads(raw_text: str, use_cache: bool = True) -> List[ExtractedLead]:
+    if not PRE_EXTRACTION_ENABLED:
+        return await extract_lead_data_with_llm(raw_text, use_cache=use_cache)
+
+    def pre_extract() -> Tuple[PreExtraction, Set[str]]:
+        # Line parsing is CPU-bound on large documents, so it leaves the
+        # event loop together with the lookup of emails it found.
+        result = pre_extract_leads(raw_text)
+        if not result.emails:
+            return result, set()
+        with get_db_connection() as conn:
+            return result, find_existing_emails(conn, result.emails)
+
+    with span(DOCUMENT_STAGE_LATENCY, "pre_extract", stage="pre_extract"):
+        result, existing = await asyncio.to_thread(pre_extract)
+        candidates = result.emails
+
+    # Resolved leads are returned even when they already exist so the bulk
+    # insert reports them as duplicates; ambiguous lines whose emails are all
+    # known are dropped before they can cost an LLM call.
+    pending = [index for index, emails in result.ambiguous if not all(email in existing for email in emails)]
+    PRE_EXTRACTED_LINES.inc(len(result.leads), outcome="resolved")
+    PRE_EXTRACTED_LINES.inc(len(result.ambiguous) - len(pending), outcome="known_duplicate")
+    PRE_EXTRACTED_LINES.inc(len(pending), outcome="sent_to_llm")
+
+    if not candidates:
+        raise DocumentProcessingError("No email addresses found in document")
+    if not pending:
+        return result.leads
+
+    llm_leads = await extract_lead_data_with_llm(build_snippets(result.lines, pending), use_cache=use_cache)
+    return merge_extracted_leads([result.leads, llm_leads])
+
+async def extract_text_cached(
+    file_content: DocumentSource,
+    file_extension: str,
+    max_chars: Optional[int] = None,
+    use_cache: bool = True,
+    content_digest: Optional[str] = None
+) -> str:
+    if file_extension == ".txt":
+        return await extract_text_from_file(file_content, file_extension, max_chars=max_chars)
+
+    cache = get_content_cache()
+    digest = content_digest or await document_digest(file_content)
+    cache_key = f"{digest}:{file_extension}:{max_chars}"
+
+    if use_cache:
+        cached = await cache.aget(TEXT_CACHE_NAMESPACE, cache_key)
+        if cached is not None:
+            return cached
+
+    raw_text = await extract_text_from_file(file_content, file_extension, max_chars=max_chars)
+    await cache.aput(TEXT_CACHE_NAMESPACE, cache_key, raw_text)
+    return raw_text
+
+async def process_document_for_lead(
+    file_content: DocumentSource,
+    file_extension: str,
+    use_cache: bool = True,
+    progress: Optional[Callable[[str, int], Awaitable[None]]] = None,
+    content_digest: Optional[str] = None
+) -> tuple[List[LeadCreate], int]:
     try:
-        raw_text = await extract_text_from_file(file_content, file_extension)
+        if progress:
+            await progress("extracting_text", 10)
+        with span(DOCUMENT_STAGE_LATENCY, "extract_text", stage="extract_text"):
+            raw_text = await extract_text_cached(
+                file_content,
+                file_extension,
+                max_chars=MAX_DOCUMENT_CHARS,
+                use_cache=use_cache,
+                content_digest=content_digest
+            )
         
         if not raw_text.strip():
             raise DocumentProcessingError("No readable text found in document")
         
-        extracted_leads_data = await extract_lead_data_with_llm(raw_text)
+        if progress:
+            await progress("extracting_leads", 40)
+        with span(DOCUMENT_STAGE_LATENCY, "extract_leads", stage="extract_leads"):
+            extracted_leads_data = await extract_leads(raw_text, use_cache=use_cache)
         
-        leads_to_create = []
-        for extracted_lead in extracted_leads_data:
-            lead_data = LeadCreate(
-                name=extracted_lead.name,
-                email=extracted_lead.email,
-                phone=extracted_lead.phone,
-                status=extracted_lead.status,
-                source=extracted_lead.source
-            )
-            leads_to_create.append(lead_data)
+        with span(DOCUMENT_STAGE_LATENCY, "build_leads", stage="build_leads"):
+            leads_to_create = []
+            for extracted_lead in extracted_leads_data:
+                lead_data = LeadCreate(
+                    name=extracted_lead.name,
+                    email=extracted_lead.email,
+                    phone=extracted_lead.phone,
+                    status=extracted_lead.status,
+                    source=extracted_lead.source
+                )
+                leads_to_create.append(lead_data)
         
         return leads_to_create, len(raw_text)
         
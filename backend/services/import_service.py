@@ -0,0 +1,238 @@
+import csv
+import os
+import re
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from database.database import get_db_connection
+from database.leads import LeadRow, insert_lead_rows
+from database.models import (
+    ImportRowError, LeadImportResponse, STATUS_CHOICES, SOURCE_CHOICES, check_phone, check_source, check_status,
+    clean_name
+)
+
+try:
+    from openpyxl import load_workbook
+except ImportError:
+    load_workbook = None
+
+IMPORT_BATCH_SIZE = int(os.getenv("CRM_IMPORT_BATCH_SIZE", "5000"))
+IMPORT_MAX_ERRORS = int(os.getenv("CRM_IMPORT_MAX_ERRORS", "1000"))
+IMPORT_EXTENSIONS = (".csv", ".xlsx")
+SNIFF_BYTES = 64 * 1024
+
+COLUMN_ALIASES = {
+    "name": ("name", "full name", "fullname", "contact", "contact name", "lead name", "lead"),
+    "first_name": ("first name", "firstname", "given name", "first"),
+    "last_name": ("last name", "lastname", "surname", "family name", "last"),
+    "email": ("email", "e mail", "email address", "e mail address", "mail"),
+    "phone": ("phone", "phone number", "mobile", "mobile phone", "cell", "telephone", "tel", "contact number"),
+    "status": ("status", "lead status", "stage"),
+    "source": ("source", "lead source", "channel"),
+}
+
+# Spreadsheets rarely match the canonical casing, so look values up
+# case-insensitively and store the canonical spelling.
+STATUS_LOOKUP = {choice.lower(): choice for choice in STATUS_CHOICES}
+SOURCE_LOOKUP = {choice.lower(): choice for choice in SOURCE_CHOICES}
+
+class LeadImportError(Exception):
+    pass
+
+def normalize_header(header: Any) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", str(header or "").lower()).strip()
+
+def resolve_columns(headers: Sequence[Any], overrides: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+    normalized = [normalize_header(header) for header in headers]
+    columns: Dict[str, int] = {}
+    for field, header in (overrides or {}).items():
+        if field not in COLUMN_ALIASES:
+            raise LeadImportError(f"Unknown lead field in column mapping: {field}")
+        key = normalize_header(header)
+        if key not in normalized:
+            raise LeadImportError(f"Column '{header}' mapped to {field} is not in the file header")
+        columns[field] = normalized.index(key)
+
+    for field, aliases in COLUMN_ALIASES.items():
+        if field in columns:
+            continue
+        for alias in aliases:
+            if alias in normalized:
+                columns[field] = normalized.index(alias)
+                break
+
+    if "name" not in columns and "first_name" not in columns:
+        raise LeadImportError(f"No name column found in header: {', '.join(str(h) for h in headers)}")
+    if "email" not in columns:
+        raise LeadImportError(f"No email column found in header: {', '.join(str(h) for h in headers)}")
+    return columns
+
+def _cell_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheet apps store phone-like numbers as floats.
+        return str(int(value))
+    return str(value).strip()
+
+def _detect_encoding(path: Path) -> str:
+    with open(path, "rb") as handle:
+        sample = handle.read(SNIFF_BYTES)
+    try:
+        sample.decode("utf-8-sig")
+        return "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # The sample may end in the middle of a multi-byte character.
+        if e.start >= len(sample) - 3:
+            return "utf-8-sig"
+        return "latin-1"
+
+def iter_csv_rows(path: Path) -> Iterator[Sequence[Any]]:
+    encoding = _detect_encoding(path)
+    with open(path, newline="", encoding=encoding) as handle:
+        sample = handle.read(SNIFF_BYTES)
+        handle.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(handle, dialect)
+
+def iter_xlsx_rows(path: Path) -> Iterator[Sequence[Any]]:
+    if load_workbook is None:
+        raise LeadImportError("XLSX import requires the openpyxl package")
+    # read_only streams rows from the sheet XML instead of loading the
+    # whole workbook into memory.
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def iter_rows(path: Path, file_extension: str) -> Iterator[Sequence[Any]]:
+    if file_extension == ".csv":
+        return iter_csv_rows(path)
+    if file_extension == ".xlsx":
+        return iter_xlsx_rows(path)
+    raise LeadImportError(f"Unsupported import file type: {file_extension}")
+
+class RowValidator:
+    FIELDS = ("name", "first_name", "last_name", "email", "phone", "status", "source")
+
+    def __init__(self, columns: Dict[str, int], default_status: str, default_source: str):
+        self.indexes = tuple(columns.get(field) for field in self.FIELDS)
+        self.default_status = check_status(default_status)
+        self.default_source = check_source(default_source)
+
+    def validate(self, row: Sequence[Any]) -> Tuple[Optional[LeadRow], Optional[Tuple[str, str]]]:
+        # Returns (row, None) or (None, (field, error)); applies the LeadBase
+        # rules to raw cell values without building a model per row.
+        width = len(row)
+        name, first_name, last_name, email, phone, status, source = (
+            _cell_text(row[index]) if index is not None and index < width else "" for index in self.indexes
+        )
+        field = "name"
+        try:
+            if not name:
+                name = " ".join(part for part in (first_name, last_name) if part)
+            name = clean_name(name)
+
+            field = "email"
+            if "@" not in email or " " in email:
+                raise ValueError("Invalid email address")
+
+            field = "phone"
+            phone = check_phone(phone or None)
+
+            field = "status"
+            status = STATUS_LOOKUP.get(status.lower(), status) if status else self.default_status
+            check_status(status)
+
+            field = "source"
+            source = SOURCE_LOOKUP.get(source.lower(), source) if source else self.default_source
+            check_source(source)
+        except ValueError as e:
+            return None, (field, str(e))
+        return (name, email, phone, status, source), None
+
+def _batches(rows: Iterator[Tuple[int, Sequence[Any]]], size: int) -> Iterator[List[Tuple[int, Sequence[Any]]]]:
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def import_leads_file(
+    path: Path,
+    file_extension: str,
+    column_mapping: Optional[Dict[str, str]] = None,
+    default_status: str = "New",
+    default_source: str = "Document",
+    batch_size: int = IMPORT_BATCH_SIZE,
+    max_errors: int = IMPORT_MAX_ERRORS,
+) -> LeadImportResponse:
+    started = time.perf_counter()
+    # Row numbers are 1-based and count the header, matching what a
+    # spreadsheet shows.
+    numbered = (
+        (number, row) for number, row in enumerate(iter_rows(path, file_extension), start=1)
+        if any(cell not in (None, "") for cell in row)
+    )
+    try:
+        _, headers = next(numbered)
+    except StopIteration:
+        raise LeadImportError("The file is empty")
+
+    columns = resolve_columns(headers, column_mapping)
+    try:
+        validator = RowValidator(columns, default_status, default_source)
+    except ValueError as e:
+        raise LeadImportError(str(e))
+
+    total = created = duplicates = invalid = 0
+    errors: List[ImportRowError] = []
+
+    def report(error: ImportRowError) -> None:
+        if len(errors) < max_errors:
+            errors.append(error)
+
+    # Each batch is parsed, validated and committed on its own so memory
+    # stays flat and a failure part-way keeps the batches already written.
+    for batch in _batches(numbered, batch_size):
+        total += len(batch)
+        valid: List[LeadRow] = []
+        valid_numbers: List[int] = []
+        for number, row in batch:
+            lead_row, error = validator.validate(row)
+            if error is not None:
+                invalid += 1
+                report(ImportRowError(row=number, status="invalid", field=error[0], error=error[1]))
+                continue
+            valid.append(lead_row)
+            valid_numbers.append(number)
+
+        if not valid:
+            continue
+        with get_db_connection() as conn:
+            inserted = insert_lead_rows(conn, valid)
+        for number, ok in zip(valid_numbers, inserted):
+            if ok:
+                created += 1
+            else:
+                duplicates += 1
+                report(ImportRowError(
+                    row=number, status="duplicate", field="email", error="Lead with this email already exists"
+                ))
+
+    return LeadImportResponse(
+        rows=total,
+        created=created,
+        duplicates=duplicates,
+        invalid=invalid,
+        column_mapping={field: str(headers[index]) for field, index in columns.items()},
+        errors=errors,
+        errors_truncated=duplicates + invalid > len(errors),
+        elapsed_seconds=round(time.perf_counter() - started, 3)
+    )
@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from database.database import get_db_connection, retry_on_busy
+from database.models import DocumentJob, LeadInDB
+from services.document_processing_service import process_document_for_lead
+from services.lead_service import bulk_create_leads
+from services.metrics_service import DOCUMENT_STAGE_LATENCY, span
+from services.upload_service import UPLOAD_DIR, SpooledUpload, remove_stale_spool_files
+
+logger = logging.getLogger(__name__)
+
+JOB_CONCURRENCY = int(os.getenv("CRM_JOB_CONCURRENCY", "4"))
+JOB_LEASE_SECONDS = float(os.getenv("CRM_JOB_LEASE_SECONDS", "120"))
+JOB_SWEEP_SECONDS = float(os.getenv("CRM_JOB_SWEEP_SECONDS", "30"))
+
+@retry_on_busy
+def _insert_job(job_id: str, filename: str, file_extension: str, file_path: str, use_cache: bool) -> None:
+    with get_db_connection() as conn:
+        conn.execute(
+            """INSERT INTO document_jobs (id, filename, file_extension, file_path, use_cache)
+               VALUES (?, ?, ?, ?, ?)""",
+            (job_id, filename, file_extension, file_path, int(use_cache))
+        )
+        conn.commit()
+
+@retry_on_busy
+def _update_job(job_id: str, owner: Optional[str] = None, **fields: Any) -> bool:
+    # With an owner, the update only applies while that worker still holds
+    # the lease, so a job re-queued and claimed elsewhere is left alone.
+    assignments = ", ".join(f"{column} = ?" for column in fields)
+    condition = "id = ?" if owner is None else "id = ? AND lease_owner = ?"
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            f"UPDATE document_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE {condition}",
+            (*fields.values(), job_id) if owner is None else (*fields.values(), job_id, owner)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+
+def _fetch_job_row(job_id: str):
+    with get_db_connection() as conn:
+        return conn.execute("SELECT * FROM document_jobs WHERE id = ?", (job_id,)).fetchone()
+
+def _fetch_leads(lead_ids: List[int]) -> List[LeadInDB]:
+    leads: List[LeadInDB] = []
+    with get_db_connection() as conn:
+        for start in range(0, len(lead_ids), 500):
+            chunk = lead_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = conn.execute(
+                f"""SELECT id, name, email, phone, status, source, created_at, updated_at
+                    FROM leads WHERE id IN ({placeholders}) ORDER BY id""",
+                chunk
+            ).fetchall()
+            leads.extend(LeadInDB(**dict(row)) for row in rows)
+    return leads
+
+@retry_on_busy
+def _claim_job(job_id: str, owner: str, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+    # Every server process may have the same job queued; the conditional
+    # update lets exactly one of them take it.
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            """UPDATE document_jobs SET status = 'processing', stage = 'reading', progress = 5,
+                   lease_owner = ?, lease_expires_at = ?, updated_at = CURRENT_TIMESTAMP
+               WHERE id = ? AND status = 'queued'""",
+            (owner, time.time() + lease_seconds, job_id)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+
+@retry_on_busy
+def _renew_lease(job_id: str, owner: str, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            """UPDATE document_jobs SET lease_expires_at = ?
+               WHERE id = ? AND lease_owner = ? AND status = 'processing'""",
+            (time.time() + lease_seconds, job_id, owner)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+
+@retry_on_busy
+def _release_jobs(owner: str) -> int:
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            """UPDATE document_jobs SET status = 'queued', stage = NULL, progress = 0,
+                   lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+               WHERE status = 'processing' AND lease_owner = ?""",
+            (owner,)
+        )
+        conn.commit()
+        return cursor.rowcount
+
+@retry_on_busy
+def _requeue_expired_jobs() -> List[str]:
+    # Jobs whose owner stopped renewing (crashed or was killed) go back to
+    # the queue; jobs with a live lease in another process are left alone.
+    with get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            """UPDATE document_jobs SET status = 'queued', stage = NULL, progress = 0,
+                   lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+               WHERE status = 'processing' AND (lease_expires_at IS NULL OR lease_expires_at < ?)""",
+            (time.time(),)
+        )
+        rows = conn.execute(
+            "SELECT id FROM document_jobs WHERE status = 'queued' ORDER BY created_at, rowid"
+        ).fetchall()
+        conn.commit()
+    return [row["id"] for row in rows]
+
+def get_job(job_id: str) -> Optional[DocumentJob]:
+    row = _fetch_job_row(job_id)
+    if row is None:
+        return None
+    lead_ids = json.loads(row["created_lead_ids"]) if row["created_lead_ids"] else []
+    return DocumentJob(
+        id=row["id"],
+        filename=row["filename"],
+        status=row["status"],
+        stage=row["stage"],
+        progress=row["progress"],
+        created_leads=_fetch_leads(lead_ids) if lead_ids else [],
+        duplicates=row["duplicates"],
+        extracted_text_length=row["extracted_text_length"],
+        error=row["error"],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"]
+    )
+
+class DocumentJobManager:
+    def __init__(self, concurrency: int = JOB_CONCURRENCY, upload_dir: str = UPLOAD_DIR):
+        self.concurrency = max(1, concurrency)
+        self.upload_dir = Path(upload_dir)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued_ids: Set[str] = set()
+        self._workers: List[asyncio.Task] = []
+        self._sweeper_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(remove_stale_spool_files, str(self.upload_dir))
+        self._queue = asyncio.Queue()
+        for job_id in await asyncio.to_thread(_requeue_expired_jobs):
+            self._enqueue(job_id)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"document-job-worker-{index}")
+            for index in range(self.concurrency)
+        ]
+        self._sweeper_task = asyncio.create_task(self._sweeper(), name="document-job-sweeper")
+
+    async def stop(self) -> None:
+        tasks = self._workers + ([self._sweeper_task] if self._sweeper_task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._sweeper_task = None
+        # Hand interrupted jobs back right away rather than when their lease expires.
+        released = await asyncio.to_thread(_release_jobs, self.worker_id)
+        if released:
+            logger.info("Returned %d interrupted document jobs to the queue", released)
+
+    def _enqueue(self, job_id: str) -> None:
+        if job_id not in self._queued_ids:
+            self._queued_ids.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def submit(
+        self, filename: str, file_extension: str, upload: SpooledUpload, use_cache: bool = True
+    ) -> str:
+        if self._queue is None:
+            raise RuntimeError("Document job manager is not running")
+        job_id = uuid.uuid4().hex
+        file_path = self.upload_dir / f"{job_id}{file_extension}"
+        # The spool file already lives under upload_dir, so this is a rename
+        # on the same filesystem rather than another copy of the document.
+        await asyncio.to_thread(os.replace, upload.path, file_path)
+        await asyncio.to_thread(_insert_job, job_id, filename, file_extension, str(file_path), use_cache)
+        self._enqueue(job_id)
+        return job_id
+
+    async def _sweeper(self) -> None:
+        # Picks up jobs left behind by another server process that died, and
+        # jobs submitted elsewhere while this process had idle workers.
+        while True:
+            await asyncio.sleep(JOB_SWEEP_SECONDS)
+            try:
+                for job_id in await asyncio.to_thread(_requeue_expired_jobs):
+                    self._enqueue(job_id)
+            except Exception:
+                logger.exception("Failed to sweep document jobs")
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued_ids.discard(job_id)
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Unexpected failure while running document job %s", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _keep_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            if not await asyncio.to_thread(_renew_lease, job_id, self.worker_id):
+                logger.warning("Lost the lease on document job %s", job_id)
+                return
+
+    async def _run_job(self, job_id: str) -> None:
+        if not await asyncio.to_thread(_claim_job, job_id, self.worker_id):
+            return
+        row = await asyncio.to_thread(_fetch_job_row, job_id)
+        lease = asyncio.create_task(self._keep_lease(job_id))
+
+        async def report(stage: str, progress: int) -> None:
+            await asyncio.to_thread(_update_job, job_id, self.worker_id, stage=stage, progress=progress)
+
+        file_path = Path(row["file_path"])
+        try:
+            leads_data, text_length = await process_document_for_lead(
+                file_path, row["file_extension"], use_cache=bool(row["use_cache"]), progress=report
+            )
+            await report("saving_leads", 90)
+            with span(DOCUMENT_STAGE_LATENCY, "save_leads", stage="save_leads"):
+                bulk_result = await asyncio.to_thread(bulk_create_leads, leads_data)
+            created_ids = [result.lead.id for result in bulk_result.results if result.status == "created"]
+            finished = await asyncio.to_thread(
+                _update_job,
+                job_id,
+                self.worker_id,
+                status="completed",
+                stage="done",
+                progress=100,
+                created_lead_ids=json.dumps(created_ids),
+                duplicates=bulk_result.duplicates,
+                extracted_text_length=text_length,
+                lease_expires_at=None
+            )
+        except Exception as e:
+            logger.warning("Document job %s failed: %s", job_id, e)
+            finished = await asyncio.to_thread(
+                _update_job, job_id, self.worker_id,
+                status="failed", stage="failed", error=str(e), lease_expires_at=None
+            )
+        finally:
+            lease.cancel()
+
+        if not finished:
+            # The lease was lost and another worker owns the job and its upload now.
+            logger.warning("Discarding the result of document job %s after losing its lease", job_id)
+            return
+        # Only finished jobs drop their spooled upload; a job interrupted by
+        # shutdown keeps it so the next startup can run it again.
+        file_path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+_job_manager: Optional[DocumentJobManager] = None
+
+def get_job_manager() -> DocumentJobManager:
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = DocumentJobManager()
+    return _job_manager
+
+async def start_job_manager() -> None:
+    await get_job_manager().start()
+
+async def stop_job_manager() -> None:
+    global _job_manager
+    if _job_manager is not None:
+        await _job_manager.stop()
+        _job_manager = None
@@ -0,0 +1,82 @@
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from pydantic import ValidationError
+
+from database.database import get_db_connection, retry_on_busy
+from database.leads import fetch_ids_by_email, insert_new_rows
+from database.models import BulkLeadResponse, BulkLeadResult, LeadCreate, LeadInDB
+from services.dedup_service import DuplicateMatch, describe_match, find_likely_duplicates
+from services.metrics_service import DEDUP_CHECKS
+
+def insert_leads(
+    conn: sqlite3.Connection, leads: Sequence[LeadCreate], check_duplicates: bool = False
+) -> Tuple[List[Optional[int]], List[Optional[DuplicateMatch]]]:
+    # BEGIN IMMEDIATE takes the write lock up front, so the duplicate probe
+    # and the insert see the same table state and no row slips in between.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        matches: List[Optional[DuplicateMatch]] = [None] * len(leads)
+        if check_duplicates:
+            matches = find_likely_duplicates(conn, [(lead.name, lead.email, lead.phone) for lead in leads])
+        candidates = [lead for lead, match in zip(leads, matches) if match is None]
+        inserted = iter(insert_new_rows(
+            conn, [(lead.name, lead.email, lead.phone, lead.status, lead.source) for lead in candidates]
+        ))
+        new_ids = fetch_ids_by_email(conn, [lead.email for lead in candidates])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    ids: List[Optional[int]] = []
+    for lead, match in zip(leads, matches):
+        ok = match is None and next(inserted)
+        ids.append(new_ids.get(lead.email) if ok else None)
+    return ids, matches
+
+@retry_on_busy
+def bulk_create_leads(
+    items: Sequence[Union[LeadCreate, Dict[str, Any]]], check_duplicates: bool = True
+) -> BulkLeadResponse:
+    results: List[Optional[BulkLeadResult]] = [None] * len(items)
+    valid: List[Tuple[int, LeadCreate]] = []
+
+    for index, item in enumerate(items):
+        if isinstance(item, LeadCreate):
+            valid.append((index, item))
+            continue
+        try:
+            valid.append((index, LeadCreate(**item)))
+        except (ValidationError, TypeError) as e:
+            results[index] = BulkLeadResult(index=index, status="invalid", error=str(e))
+
+    if valid:
+        with get_db_connection() as conn:
+            ids, matches = insert_leads(conn, [lead for _, lead in valid], check_duplicates)
+
+        for (index, lead), lead_id, match in zip(valid, ids, matches):
+            if match is not None:
+                if match.batch_index is not None:
+                    # Report the row's position in the request, not in the valid subset.
+                    match = match._replace(batch_index=valid[match.batch_index][0])
+                results[index] = BulkLeadResult(index=index, status="duplicate", error=describe_match(match))
+            elif lead_id is None:
+                results[index] = BulkLeadResult(
+                    index=index, status="duplicate", error="Lead with this email already exists"
+                )
+            else:
+                results[index] = BulkLeadResult(
+                    index=index, status="created", lead=LeadInDB(id=lead_id, **lead.dict())
+                )
+        if check_duplicates:
+            likely = sum(1 for match in matches if match is not None)
+            DEDUP_CHECKS.inc(len(matches) - likely, outcome="unique")
+            DEDUP_CHECKS.inc(likely, outcome="duplicate")
+
+    return BulkLeadResponse(
+        created=sum(1 for r in results if r.status == "created"),
+        duplicates=sum(1 for r in results if r.status == "duplicate"),
+        invalid=sum(1 for r in results if r.status == "invalid"),
+        results=results
+    )
@@ -0,0 +1,228 @@
+import asyncio
+import importlib
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Type
+from uuid import UUID
+
+import httpx
+from langchain.chat_models import init_chat_model
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.output_parsers import BaseOutputParser, StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+from dotenv import load_dotenv
+
+from services.metrics_service import (
+    LLM_FIRST_TOKEN_LATENCY, LLM_LATENCY, LLM_MODEL_LATENCY, LLM_TOKENS, record_timing
+)
+
+load_dotenv()
+
+LLM_PROVIDER = os.getenv("CRM_LLM_PROVIDER", "groq")
+LLM_MODEL = os.getenv("CRM_LLM_MODEL", "llama-3.3-70b-versatile")
+LLM_TIMEOUT_SECONDS = float(os.getenv("CRM_LLM_TIMEOUT_SECONDS", "60"))
+LLM_RETRY_ATTEMPTS = int(os.getenv("CRM_LLM_RETRY_ATTEMPTS", "3"))
+LLM_CONCURRENCY = int(os.getenv("CRM_LLM_CONCURRENCY", "16"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("CRM_LLM_KEEPALIVE_CONNECTIONS", "20"))
+
+TRANSIENT_SDK_ERRORS = ("RateLimitError", "APITimeoutError", "APIConnectionError")
+
+def transient_llm_errors() -> Tuple[Type[BaseException], ...]:
+    # Rate limits, timeouts and dropped connections are worth retrying;
+    # auth failures, bad requests and parse errors would fail the same way.
+    errors: List[Type[BaseException]] = [httpx.TransportError, TimeoutError]
+    for module_name in ("groq", "openai"):
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        errors.extend(getattr(module, name) for name in TRANSIENT_SDK_ERRORS if hasattr(module, name))
+    return tuple(errors)
+
+class ChainSpec:
+    def __init__(self, template: str, parser_factory: Callable[[], BaseOutputParser] = StrOutputParser):
+        self.template = template
+        self.parser_factory = parser_factory
+
+_chain_specs: Dict[str, ChainSpec] = {}
+
+def register_chain(
+    name: str, template: str, parser_factory: Callable[[], BaseOutputParser] = StrOutputParser
+) -> None:
+    _chain_specs[name] = ChainSpec(template, parser_factory)
+
+class LLMUsageCallback(BaseCallbackHandler):
+    # Times the model call on its own (the chain timing also covers prompt
+    # formatting and output parsing) and counts tokens the provider reports.
+    def __init__(self, chain_name: str):
+        self.chain_name = chain_name
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            LLM_MODEL_LATENCY.observe(time.perf_counter() - started, chain=self.chain_name)
+
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    LLM_TOKENS.inc(usage.get("input_tokens", 0), chain=self.chain_name, kind="prompt")
+                    LLM_TOKENS.inc(usage.get("output_tokens", 0), chain=self.chain_name, kind="completion")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started.pop(run_id, None)
+
+class LLMRuntime:
+    def __init__(
+        self,
+        model: Runnable,
+        model_name: str = LLM_MODEL,
+        max_concurrency: int = LLM_CONCURRENCY,
+        retry_attempts: int = LLM_RETRY_ATTEMPTS,
+        http_clients: Optional[List[Any]] = None,
+    ):
+        self.model_name = model_name
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._http_clients = http_clients or []
+        if retry_attempts > 1:
+            model = model.with_retry(
+                retry_if_exception_type=transient_llm_errors(),
+                stop_after_attempt=retry_attempts,
+                wait_exponential_jitter=True,
+            )
+        self.model = model
+        self._chains: Dict[str, Runnable] = {}
+        for name in list(_chain_specs):
+            self._build_chain(name)
+
+    def _build_chain(self, name: str) -> Runnable:
+        spec = _chain_specs[name]
+        parser = spec.parser_factory()
+        prompt = ChatPromptTemplate.from_template(spec.template)
+        if "format_instructions" in prompt.input_variables:
+            prompt = prompt.partial(format_instructions=parser.get_format_instructions())
+        chain = prompt | self.model | parser
+        self._chains[name] = chain
+        return chain
+
+    def chain(self, name: str) -> Runnable:
+        chain = self._chains.get(name)
+        if chain is None:
+            if name not in _chain_specs:
+                raise KeyError(f"Unknown LLM chain: {name}")
+            chain = self._build_chain(name)
+        return chain
+
+    async def ainvoke(self, name: str, inputs: Dict[str, Any]) -> Any:
+        chain = self.chain(name)
+        async with self._semaphore:
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await chain.ainvoke(inputs, config={"callbacks": [LLMUsageCallback(name)]})
+                outcome = "success"
+                return result
+            finally:
+                elapsed = time.perf_counter() - started
+                LLM_LATENCY.observe(elapsed, chain=name, outcome=outcome)
+                record_timing("llm", elapsed)
+
+    async def astream(self, name: str, inputs: Dict[str, Any]) -> AsyncIterator[Any]:
+        # The concurrency slot is held until the stream finishes or the
+        # consumer closes it, so an abandoned stream frees capacity at once.
+        chain = self.chain(name)
+        async with self._semaphore:
+            started = time.perf_counter()
+            first_chunk = True
+            outcome = "error"
+            try:
+                async for chunk in chain.astream(inputs, config={"callbacks": [LLMUsageCallback(name)]}):
+                    if first_chunk:
+                        LLM_FIRST_TOKEN_LATENCY.observe(time.perf_counter() - started, chain=name)
+                        first_chunk = False
+                    yield chunk
+                outcome = "success"
+            except (asyncio.CancelledError, GeneratorExit):
+                outcome = "cancelled"
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                LLM_LATENCY.observe(elapsed, chain=name, outcome=outcome)
+                record_timing("llm", elapsed)
+
+    async def abatch(
+        self,
+        name: str,
+        inputs: List[Dict[str, Any]],
+        max_concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+    ) -> List[Any]:
+        # Every item still goes through the runtime-wide semaphore, so one large
+        # document cannot starve interactive requests of LLM capacity.
+        local_limit = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+
+        async def run(item: Dict[str, Any]) -> Any:
+            async with local_limit:
+                return await self.ainvoke(name, item)
+
+        return await asyncio.gather(*(run(item) for item in inputs), return_exceptions=return_exceptions)
+
+    async def aclose(self) -> None:
+        for client in self._http_clients:
+            close = getattr(client, "aclose", None) or getattr(client, "close")
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+
+def build_default_runtime() -> LLMRuntime:
+    limits = httpx.Limits(
+        max_connections=max(LLM_CONCURRENCY, LLM_KEEPALIVE_CONNECTIONS),
+        max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=60.0,
+    )
+    timeout = httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0)
+    http_client = httpx.Client(limits=limits, timeout=timeout)
+    http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    # Retries are handled once by the runtime with jittered backoff, so the
+    # provider SDK's own retry loop is switched off to avoid multiplying them.
+    model = init_chat_model(
+        model_provider=LLM_PROVIDER,
+        model=LLM_MODEL,
+        temperature=0,
+        timeout=LLM_TIMEOUT_SECONDS,
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+    return LLMRuntime(model, model_name=LLM_MODEL, http_clients=[http_async_client, http_client])
+
+_runtime: Optional[LLMRuntime] = None
+
+def get_llm_runtime() -> LLMRuntime:
+    global _runtime
+    if _runtime is None:
+        _runtime = build_default_runtime()
+    return _runtime
+
+def set_llm_runtime(runtime: Optional[LLMRuntime]) -> None:
+    global _runtime
+    _runtime = runtime
+
+def init_llm_runtime() -> LLMRuntime:
+    return get_llm_runtime()
+
+async def close_llm_runtime() -> None:
+    global _runtime
+    runtime, _runtime = _runtime, None
+    if runtime is not None:
+        await runtime.aclose()
@@ -1,10 +1,10 @@
-from langchain.chat_models import init_chat_model
-from langchain_core.prompts import ChatPromptTemplate
-from dotenv import load_dotenv
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 
 from database.models import LeadInDB
-
-load_dotenv()
+from services.cache_service import get_interaction_cache
+from services.llm_runtime import get_llm_runtime, register_chain
+from services.metrics_service import INTERACTION_LATENCY
 
 LLM_SUGGEST_FOLLOW_UP_PROMPT = """
 You are a helpful CRM assistant. Given the following lead details, suggest a concise follow-up action.
@@ -42,38 +42,92 @@ Lead Source: {source}
 Response:
 """
 
-async def interact_with_llm(query: str, lead: LeadInDB) -> str:
-    llm = init_chat_model(model_provider = "groq", model = "llama-3.3-70b-versatile", temperature = 0)
+register_chain("suggest_follow_up", LLM_SUGGEST_FOLLOW_UP_PROMPT)
+register_chain("lead_details", LLM_LEAD_DETAILS_PROMPT)
+register_chain("default_interaction", LLM_DEFAULT_PROMPT)
+
+def detect_intent(query: str) -> str:
+    lowered = query.lower()
+    if "suggest follow-up" in lowered:
+        return "suggest_follow_up"
+    elif "lead details" in lowered:
+        return "lead_details"
+    return "default_interaction"
 
-    if "suggest follow-up" in query.lower():
-        prompt = ChatPromptTemplate.from_template(LLM_SUGGEST_FOLLOW_UP_PROMPT)
-        chain = prompt | llm
-        response = await chain.ainvoke({
+def build_interaction_inputs(intent: str, query: str, lead: LeadInDB) -> Dict[str, Any]:
+    if intent == "suggest_follow_up":
+        return {
             "name": lead.name,
             "email": lead.email,
             "status": lead.status
-        })
-        return response.content
-    elif "lead details" in query.lower():
-        prompt = ChatPromptTemplate.from_template(LLM_LEAD_DETAILS_PROMPT)
-        chain = prompt | llm
-        response = await chain.ainvoke({
-            "name": lead.name,
-            "email": lead.email,
-            "phone": lead.phone,
-            "status": lead.status,
-            "source": lead.source
-        })
-        return response.content
-    else:
-        prompt = ChatPromptTemplate.from_template(LLM_DEFAULT_PROMPT)
-        chain = prompt | llm
-        response = await chain.ainvoke({
-            "query": query,
+        }
+    elif intent == "lead_details":
+        return {
             "name": lead.name,
             "email": lead.email,
             "phone": lead.phone,
             "status": lead.status,
             "source": lead.source
-        })
-        return response.content
\ No newline at end of file
+        }
+    return {
+        "query": query,
+        "name": lead.name,
+        "email": lead.email,
+        "phone": lead.phone,
+        "status": lead.status,
+        "source": lead.source
+    }
+
+def interaction_cache_key(intent: str, query: str, lead: LeadInDB, version: Optional[object] = None) -> Tuple:
+    # The fixed intents ignore the free-text query, so any phrasing of
+    # "suggest follow-up" for the same lead version shares one entry.
+    cache_query = query if intent == "default_interaction" else ""
+    return get_interaction_cache().make_key(
+        lead.id, lead.updated_at if version is None else version, intent, cache_query
+    )
+
+async def interact_with_llm(
+    query: str, lead: LeadInDB, use_cache: bool = True, version: Optional[object] = None
+) -> str:
+    intent = detect_intent(query)
+    cache = get_interaction_cache()
+    key = interaction_cache_key(intent, query, lead, version)
+
+    started = time.perf_counter()
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            INTERACTION_LATENCY.observe(time.perf_counter() - started, intent=intent, cache="hit")
+            return cached
+
+    with INTERACTION_LATENCY.time(intent=intent, cache="miss" if use_cache else "bypass"):
+        response = await get_llm_runtime().ainvoke(intent, build_interaction_inputs(intent, query, lead))
+    cache.put(key, response)
+    return response
+
+async def stream_interaction(
+    query: str, lead: LeadInDB, use_cache: bool = True, version: Optional[object] = None
+) -> AsyncIterator[Tuple[str, bool]]:
+    # Yields (text, cached) pairs. A cache hit arrives as one chunk; a fresh
+    # answer is cached only once the model has streamed all of it.
+    intent = detect_intent(query)
+    cache = get_interaction_cache()
+    key = interaction_cache_key(intent, query, lead, version)
+
+    started = time.perf_counter()
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            INTERACTION_LATENCY.observe(time.perf_counter() - started, intent=intent, cache="hit")
+            yield cached, True
+            return
+
+    parts = []
+    async for chunk in get_llm_runtime().astream(intent, build_interaction_inputs(intent, query, lead)):
+        if chunk:
+            parts.append(chunk)
+            yield chunk, False
+    INTERACTION_LATENCY.observe(
+        time.perf_counter() - started, intent=intent, cache="miss" if use_cache else "bypass"
+    )
+    cache.put(key, "".join(parts))
@@ -0,0 +1,310 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Generator, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_SECONDS = float(os.getenv("CRM_SLOW_REQUEST_SECONDS", "1.0"))
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+
+SQL_OPERATIONS = frozenset({
+    "SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH", "BEGIN", "COMMIT", "ROLLBACK", "PRAGMA",
+    "CREATE", "DROP", "ALTER",
+})
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    rendered = ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs)
+    return f"{{{rendered}}}" if rendered else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum.
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Generator[None, None, None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in series:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _format_labels(labels + [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+class Gauge:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Sequence[str], float]]],
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            samples = list(self.collect())
+        except Exception as e:
+            logger.warning("Failed to collect gauge %s: %s", self.name, e)
+            samples = []
+        for key, value in samples:
+            lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Sequence[str], float]]],
+    ) -> Gauge:
+        # Gauges are sampled at scrape time, so re-registering replaces the
+        # collector (the app may restart its pools within one process).
+        gauge = Gauge(name, documentation, labelnames, collect)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram(
+    "crm_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+DB_QUERY_LATENCY = registry.histogram(
+    "crm_db_query_duration_seconds", "SQLite statement time by operation and phase",
+    ("operation", "phase"), buckets=DB_BUCKETS
+)
+DB_POOL_WAIT = registry.histogram(
+    "crm_db_pool_wait_seconds", "Time spent waiting for a pooled database connection", buckets=DB_BUCKETS
+)
+DB_POOL_TIMEOUTS = registry.counter(
+    "crm_db_pool_timeouts_total", "Connection checkouts that timed out waiting for the pool"
+)
+DB_BUSY_RETRIES = registry.counter(
+    "crm_db_busy_retries_total", "Write transactions retried after SQLITE_BUSY", ("operation",)
+)
+LLM_LATENCY = registry.histogram(
+    "crm_llm_request_duration_seconds", "LLM chain latency including prompt formatting and output parsing",
+    ("chain", "outcome")
+)
+LLM_MODEL_LATENCY = registry.histogram(
+    "crm_llm_model_duration_seconds", "Time spent inside the model call alone", ("chain",)
+)
+LLM_FIRST_TOKEN_LATENCY = registry.histogram(
+    "crm_llm_time_to_first_token_seconds", "Time until a streamed LLM response produced its first chunk", ("chain",)
+)
+LLM_TOKENS = registry.counter("crm_llm_tokens_total", "LLM tokens consumed", ("chain", "kind"))
+INTERACTION_LATENCY = registry.histogram(
+    "crm_lead_interaction_duration_seconds", "Lead interaction latency by intent and cache result",
+    ("intent", "cache")
+)
+DOCUMENT_STAGE_LATENCY = registry.histogram(
+    "crm_document_stage_duration_seconds", "Document processing time by pipeline stage", ("stage",)
+)
+WORKFLOW_ACTIONS = registry.counter(
+    "crm_workflow_actions_total", "Workflow actions executed by action and outcome", ("action", "outcome")
+)
+OUTBOX_DELIVERIES = registry.counter(
+    "crm_outbox_deliveries_total", "Outbox emails handed to the mail backend by outcome", ("outcome",)
+)
+DEDUP_CHECKS = registry.counter(
+    "crm_dedup_checks_total", "Leads checked for likely duplicates on insert by outcome", ("outcome",)
+)
+
+# Per-request breakdown used for the Server-Timing header and the slow
+# request log. The list is shared by reference with threadpool workers, which
+# run in a copy of the request context, so their spans land here too.
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+def record_timing(name: str, seconds: float) -> None:
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+@contextmanager
+def span(histogram: Histogram, timing_name: Optional[str] = None, **labels: str) -> Generator[None, None, None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, **labels)
+        if timing_name:
+            record_timing(timing_name, elapsed)
+
+def sql_operation(sql: str) -> str:
+    parts = sql.lstrip().split(None, 1)
+    operation = parts[0].upper() if parts else ""
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+def observe_db_query(sql: str, phase: str, seconds: float) -> None:
+    DB_QUERY_LATENCY.observe(seconds, operation=sql_operation(sql), phase=phase)
+    record_timing("db", seconds)
+
+def observe_pool_wait(seconds: float, timed_out: bool) -> None:
+    DB_POOL_WAIT.observe(seconds)
+    if timed_out:
+        DB_POOL_TIMEOUTS.inc()
+    record_timing("db_pool_wait", seconds)
+
+def summarize_timings(timings: List[Tuple[str, float]]) -> Dict[str, Tuple[int, float]]:
+    summary: Dict[str, Tuple[int, float]] = {}
+    for name, seconds in timings:
+        count, total = summary.get(name, (0, 0.0))
+        summary[name] = (count + 1, total + seconds)
+    return summary
+
+def server_timing_header(summary: Dict[str, Tuple[int, float]], total: float) -> str:
+    entries = [f'{name};dur={seconds * 1000:.2f};desc="{count}x"' for name, (count, seconds) in summary.items()]
+    entries.append(f"app;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware so streaming responses are
+    # timed until their last chunk and are not buffered by the middleware.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                header = server_timing_header(summarize_timings(timings), time.perf_counter() - started)
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_timings.reset(token)
+            route = scope.get("route")
+            # Label by route template, never the raw path, to keep cardinality bounded.
+            route_label = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.observe(elapsed, method=scope["method"], route=route_label, status=str(status_code))
+            if elapsed >= SLOW_REQUEST_SECONDS:
+                breakdown = ", ".join(
+                    f"{name}={seconds * 1000:.1f}ms/{count}"
+                    for name, (count, seconds) in summarize_timings(timings).items()
+                )
+                logger.warning(
+                    "Slow request %s %s took %.1fms (%s)",
+                    scope["method"], scope["path"], elapsed * 1000, breakdown or "no spans"
+                )
+
+def render_metrics() -> str:
+    return registry.render()
@@ -0,0 +1,88 @@
+import cProfile
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("CRM_PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("CRM_PROFILE_DIR", "./profiles")
+PROFILE_HEADER = b"x-profile"
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+class RequestProfiler:
+    # pyinstrument samples the stack and follows the request across awaits;
+    # without it, cProfile traces every call on the event loop thread, so its
+    # numbers include whatever other requests were interleaved meanwhile.
+    def __init__(self):
+        if SamplingProfiler is not None:
+            self._profiler = SamplingProfiler(interval=0.001, async_mode="enabled")
+            self.extension = ".html"
+        else:
+            self._profiler = cProfile.Profile()
+            self.extension = ".prof"
+
+    def start(self) -> None:
+        if SamplingProfiler is not None:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self, path: Path) -> None:
+        if SamplingProfiler is not None:
+            self._profiler.stop()
+            path.write_text(self._profiler.output_html())
+        else:
+            self._profiler.disable()
+            self._profiler.dump_stats(str(path))
+
+def profile_path(method: str, path: str, extension: str, profile_dir: str = PROFILE_DIR) -> Path:
+    slug = path.strip("/").replace("/", "_") or "root"
+    return Path(profile_dir) / f"{time.strftime('%Y%m%d-%H%M%S')}-{method.lower()}-{slug}-{uuid.uuid4().hex[:8]}{extension}"
+
+class ProfilingMiddleware:
+    # Only requests carrying "X-Profile: 1" are profiled, and only when
+    # CRM_PROFILING_ENABLED is set; the output file is named in X-Profile-File.
+    def __init__(self, app, enabled: bool = PROFILING_ENABLED, profile_dir: str = PROFILE_DIR):
+        self.app = app
+        self.enabled = enabled
+        self.profile_dir = profile_dir
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        Path(self.profile_dir).mkdir(parents=True, exist_ok=True)
+        profiler = RequestProfiler()
+        output = profile_path(scope["method"], scope["path"], profiler.extension, self.profile_dir)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-file", output.name.encode("latin-1"))
+                ]
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            try:
+                profiler.stop(output)
+                logger.info("Wrote request profile for %s %s to %s", scope["method"], scope["path"], output)
+            except Exception as e:
+                logger.warning("Failed to write request profile: %s", e)
+
+    @staticmethod
+    def _requested(scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER:
+                return value.strip().lower() in (b"1", b"true", b"yes")
+        return False
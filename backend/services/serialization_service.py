@@ -0,0 +1,45 @@
+import json
+import sqlite3
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# LeadInDB's field order; the model always emits every field, null or not.
+LEAD_FIELDS = ("name", "email", "phone", "status", "source", "id", "created_at", "updated_at")
+TIMESTAMP_FIELDS = ("created_at", "updated_at")
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    # Same output as Starlette's JSONResponse.
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def _iso_timestamp(value: Optional[str]) -> Optional[str]:
+    # SQLite's CURRENT_TIMESTAMP is "YYYY-MM-DD HH:MM:SS"; a datetime field
+    # would serialize it with a "T" separator.
+    if value is None or len(value) < 11 or value[10] != " ":
+        return value
+    return f"{value[:10]}T{value[11:]}"
+
+def trusted_lead(row: sqlite3.Row) -> Dict[str, Any]:
+    # Leads were validated by LeadBase on the way in, so a row read back from
+    # our own table is serialized as-is instead of being rebuilt as LeadInDB.
+    # `manage.py check-serialization` checks the bytes match the model's.
+    columns = row.keys()
+    lead = {field: row[field] if field in columns else None for field in LEAD_FIELDS}
+    for field in TIMESTAMP_FIELDS:
+        lead[field] = _iso_timestamp(lead[field])
+    return lead
+
+def json_response(content: Any, headers: Optional[Mapping[str, str]] = None) -> Response:
+    return Response(content=dumps(content), media_type="application/json", headers=dict(headers) if headers else None)
+
+def trusted_leads_response(
+    rows: Sequence[sqlite3.Row], headers: Optional[Mapping[str, str]] = None
+) -> Response:
+    return json_response([trusted_lead(row) for row in rows], headers)
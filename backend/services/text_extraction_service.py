@@ -0,0 +1,122 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple, Union
+
+from pypdf import PdfReader
+
+PDF_WORKERS = int(os.getenv("CRM_PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("CRM_PDF_PAGES_PER_TASK", "16"))
+
+PdfSource = Union[bytes, str]
+
+def _extract_page_range(
+    source: PdfSource, start: int, end: int, max_chars: Optional[int]
+) -> Tuple[int, List[str]]:
+    # A path lets each worker open the file itself: only the path crosses the
+    # process boundary and pypdf reads the objects it needs from disk.
+    reader = PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+    total_pages = len(reader.pages)
+    pages: List[str] = []
+    collected = 0
+    for page_number in range(start, min(end, total_pages)):
+        text = reader.pages[page_number].extract_text() or ""
+        pages.append(text)
+        collected += len(text) + 1
+        if max_chars is not None and collected >= max_chars:
+            break
+    return total_pages, pages
+
+class PdfExtractionEngine:
+    def __init__(self, max_workers: int = PDF_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK):
+        self.max_workers = max(1, max_workers)
+        self.pages_per_task = max(1, pages_per_task)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers do not inherit the server's threads, locks
+                # or open SQLite handles the way forked children would.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _reset_executor(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def extract(self, source: Union[PdfSource, os.PathLike], max_chars: Optional[int] = None) -> str:
+        if isinstance(source, os.PathLike):
+            source = os.fspath(source)
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            return await self._extract(loop, executor, source, max_chars)
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            raise
+
+    async def _extract(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        executor: ProcessPoolExecutor,
+        source: PdfSource,
+        max_chars: Optional[int],
+    ) -> str:
+        step = self.pages_per_task
+
+        # The first range also reports the page count, so short documents
+        # finish in a single task and long ones only fan out when needed.
+        total_pages, pages = await loop.run_in_executor(
+            executor, _extract_page_range, source, 0, step, max_chars
+        )
+        collected = sum(len(page) + 1 for page in pages)
+        if total_pages <= step or (max_chars is not None and collected >= max_chars):
+            return "\n".join(pages)
+
+        futures = [
+            loop.run_in_executor(executor, _extract_page_range, source, start, start + step, max_chars)
+            for start in range(step, total_pages, step)
+        ]
+        try:
+            for future in futures:
+                _, chunk = await future
+                pages.extend(chunk)
+                collected += sum(len(page) + 1 for page in chunk)
+                if max_chars is not None and collected >= max_chars:
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return "\n".join(pages)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+_engine: Optional[PdfExtractionEngine] = None
+
+def get_pdf_engine() -> PdfExtractionEngine:
+    global _engine
+    if _engine is None:
+        _engine = PdfExtractionEngine()
+    return _engine
+
+def shutdown_pdf_engine() -> None:
+    global _engine
+    if _engine is not None:
+        _engine.shutdown()
+        _engine = None
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("CRM_UPLOAD_DIR", "./uploads")
+MAX_FILE_SIZE = int(os.getenv("CRM_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+MAX_IMPORT_SIZE = int(os.getenv("CRM_MAX_IMPORT_BYTES", str(500 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("CRM_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Headroom for multipart boundaries and part headers around the file itself.
+MULTIPART_OVERHEAD = 64 * 1024
+STALE_SPOOL_SECONDS = 3600
+
+class UploadTooLargeError(Exception):
+    pass
+
+def upload_too_large_detail(max_size: int = MAX_FILE_SIZE) -> str:
+    return f"File size exceeds maximum allowed size of {max_size} bytes"
+
+class SpooledUpload:
+    def __init__(self, path: Path, size: int, sha256: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+def spool_dir(upload_dir: str = UPLOAD_DIR) -> Path:
+    return Path(upload_dir) / "incoming"
+
+def _open_spool_file(directory: Path, suffix: str):
+    directory.mkdir(parents=True, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=directory, suffix=suffix, delete=False)
+
+async def spool_upload(
+    file: UploadFile,
+    suffix: str = "",
+    max_size: int = MAX_FILE_SIZE,
+    upload_dir: str = UPLOAD_DIR,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> SpooledUpload:
+    # Copies the upload to disk one chunk at a time, hashing as it goes, so a
+    # request never holds more than one chunk of the file in memory and an
+    # oversized file is abandoned as soon as it crosses the limit.
+    handle = await run_in_threadpool(_open_spool_file, spool_dir(upload_dir), suffix)
+    path = Path(handle.name)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLargeError(upload_too_large_detail(max_size))
+            digest.update(chunk)
+            await run_in_threadpool(handle.write, chunk)
+    except BaseException:
+        handle.close()
+        path.unlink(missing_ok=True)
+        raise
+    await run_in_threadpool(handle.close)
+    return SpooledUpload(path, size, digest.hexdigest())
+
+def file_sha256(path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def remove_stale_spool_files(upload_dir: str = UPLOAD_DIR, max_age: float = STALE_SPOOL_SECONDS) -> int:
+    # Spool files are normally moved or deleted by the request that wrote
+    # them; anything this old was left behind by a crashed process.
+    directory = spool_dir(upload_dir)
+    if not directory.is_dir():
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in directory.iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+class UploadSizeLimitMiddleware:
+    # Rejects oversized uploads before the multipart parser buffers them:
+    # immediately when Content-Length is over the limit, and mid-stream for
+    # chunked bodies as soon as the running byte count crosses it.
+    def __init__(self, app, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        limits = path_limits or {"/documents/import": MAX_IMPORT_SIZE, "/documents": MAX_FILE_SIZE}
+        # Longest prefix first, so a specific route can raise its own limit.
+        self.path_limits = sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _limit_for(self, path: str) -> Optional[int]:
+        for prefix, limit in self.path_limits:
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send):
+        limit = self._limit_for(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        max_body_size = limit + MULTIPART_OVERHEAD
+        declared = self._content_length(scope)
+        if declared is not None and declared > max_body_size:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                        detail=upload_too_large_detail(limit)
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    def _content_length(scope) -> Optional[int]:
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    async def _reject(self, send, limit: int) -> None:
+        body = json.dumps({"detail": upload_too_large_detail(limit)}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_413_CONTENT_TOO_LARGE,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,12 +1,400 @@
-from database.models import LeadInDB
-from typing import Dict
-
-async def send_email_action(lead: LeadInDB, subject: str, body: str) -> Dict[str, str]:
-    print(f"Simulating Email Send to: {lead.email}")
-    print(f"Subject: {subject}")
-    print(f"Body: {body}")
-    return {"status": "success", "message": f"Email simulated to {lead.email}"}
-
-async def update_status_action(lead: LeadInDB, new_status: str) -> Dict[str, str]:
-    print(f"Simulating Status Update for {lead.name}: {lead.status} -> {new_status}")
-    return {"status": "success", "message": f"Status simulated for {lead.name} to {new_status}"}
\ No newline at end of file
+import asyncio
+import json
+import logging
+import os
+import re
+import smtplib
+import socket
+import time
+import uuid
+from collections import defaultdict
+from email.message import EmailMessage
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from database.database import get_db_connection, retry_on_busy
+from database.leads import iter_lead_chunks
+from database.models import OutboxDrainResponse, WorkflowAction, WorkflowRunRequest, WorkflowRunResponse
+from services.cache_service import get_interaction_cache
+from services.metrics_service import OUTBOX_DELIVERIES, WORKFLOW_ACTIONS
+
+logger = logging.getLogger(__name__)
+
+WORKFLOW_CONCURRENCY = int(os.getenv("CRM_WORKFLOW_CONCURRENCY", "16"))
+WORKFLOW_BATCH_SIZE = int(os.getenv("CRM_WORKFLOW_BATCH_SIZE", "2000"))
+# Leads per second across the whole run; 0 means unlimited.
+WORKFLOW_RATE_LIMIT = float(os.getenv("CRM_WORKFLOW_RATE_LIMIT", "0"))
+EMAIL_BACKEND = os.getenv("CRM_EMAIL_BACKEND", "log")
+SMTP_HOST = os.getenv("CRM_SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("CRM_SMTP_PORT", "1025"))
+EMAIL_SENDER = os.getenv("CRM_EMAIL_SENDER", "crm@localhost")
+OUTBOX_DRAIN_BATCH = int(os.getenv("CRM_OUTBOX_DRAIN_BATCH", "200"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("CRM_OUTBOX_MAX_ATTEMPTS", "3"))
+# Must outlast sending one drain batch (SMTP calls time out after 30s each).
+OUTBOX_LEASE_SECONDS = float(os.getenv("CRM_OUTBOX_LEASE_SECONDS", "600"))
+
+TEMPLATE_FIELD = re.compile(r"\{(name|email|phone|status|source)\}")
+
+# (run_id, lead_id, action, status, recipient, subject, body, detail)
+OutboxRow = Tuple[str, int, str, str, Optional[str], Optional[str], Optional[str], Optional[str]]
+# (index of the action's row in the outbox batch, lead_id)
+StatusChange = Tuple[int, int]
+
+def render_template(template: str, lead: Dict[str, Any]) -> str:
+    # Only lead fields are substituted, unlike str.format which would also
+    # allow attribute lookups from user-supplied templates.
+    return TEMPLATE_FIELD.sub(lambda match: str(lead.get(match.group(1)) or ""), template)
+
+async def send_email_action(lead: Dict[str, Any], subject: str, body: str) -> Dict[str, str]:
+    # Delivery happens when the outbox is drained; here the message is only
+    # rendered for this lead.
+    return {
+        "status": "pending",
+        "recipient": lead["email"],
+        "subject": render_template(subject, lead),
+        "body": render_template(body, lead),
+        "message": f"Email queued to {lead['email']}",
+    }
+
+async def update_status_action(lead: Dict[str, Any], new_status: str) -> Dict[str, str]:
+    if lead["status"] == new_status:
+        return {"status": "skipped", "message": f"Status is already {new_status}"}
+    return {"status": "done", "message": f"Status {lead['status']} -> {new_status}"}
+
+async def execute_action(action: WorkflowAction, lead: Dict[str, Any]) -> Dict[str, str]:
+    if action.type == "send_email":
+        return await send_email_action(lead, action.subject, action.body)
+    return await update_status_action(lead, action.new_status)
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        # Hands out evenly spaced start times; no await happens between
+        # reading and advancing the slot, so no lock is needed.
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+@retry_on_busy
+def _apply_batch(status_changes: Dict[Tuple[int, str], List[StatusChange]], outbox_rows: List[OutboxRow]) -> List[str]:
+    # Status actions are queued as "done" from the lead as it was read; under
+    # the write lock each one's outbox row is rewritten with what the UPDATE
+    # actually changed, since the lead may have been changed or deleted since.
+    # Keys sort by action position, so a lead's updates apply in action order.
+    outcomes: List[str] = []
+    with get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for (_, new_status), changes in sorted(status_changes.items()):
+                lead_ids = json.dumps([lead_id for _, lead_id in changes])
+                before = {
+                    row["id"]: row["status"] for row in conn.execute(
+                        "SELECT id, status FROM leads WHERE id IN (SELECT value FROM json_each(?))", (lead_ids,)
+                    )
+                }
+                conn.execute(
+                    """UPDATE leads SET status = ?, updated_at = CURRENT_TIMESTAMP
+                       WHERE id IN (SELECT value FROM json_each(?)) AND status != ?""",
+                    (new_status, lead_ids, new_status)
+                )
+                for index, lead_id in changes:
+                    old_status = before.get(lead_id)
+                    if old_status is None:
+                        outcome, detail = "skipped", "Lead no longer exists"
+                    elif old_status == new_status:
+                        outcome, detail = "skipped", f"Status is already {new_status}"
+                    else:
+                        outcome, detail = "done", f"Status {old_status} -> {new_status}"
+                    outbox_rows[index] = outbox_rows[index][:3] + (outcome, None, None, None, detail)
+                    outcomes.append(outcome)
+            conn.executemany(
+                """INSERT INTO workflow_outbox
+                       (run_id, lead_id, action, status, recipient, subject, body, detail)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                outbox_rows
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    cache = get_interaction_cache()
+    for changes in status_changes.values():
+        for _, lead_id in changes:
+            cache.invalidate_lead(lead_id)
+    return outcomes
+
+class WorkflowRun:
+    def __init__(
+        self,
+        request: WorkflowRunRequest,
+        concurrency: int = WORKFLOW_CONCURRENCY,
+        batch_size: int = WORKFLOW_BATCH_SIZE,
+    ):
+        self.request = request
+        self.run_id = uuid.uuid4().hex
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        rate = request.rate_limit or WORKFLOW_RATE_LIMIT
+        self.limiter = RateLimiter(rate) if rate > 0 else None
+        self.matched = self.status_updated = self.emails_queued = self.skipped = self.failed = 0
+        self._status_changes: Dict[Tuple[int, str], List[StatusChange]] = defaultdict(list)
+        self._outbox: List[OutboxRow] = []
+        self._flush_lock = asyncio.Lock()
+
+    async def _produce(self, queue: asyncio.Queue) -> None:
+        # Keyset chunks in id order: a status update only touches leads that
+        # were already read, so it never shifts the rows still to come.
+        chunks = iter_lead_chunks(self.request.status_filter, self.request.source_filter)
+        while True:
+            rows = await run_in_threadpool(next, chunks, None)
+            if rows is None:
+                break
+            for row in rows:
+                await queue.put(dict(zip(row.keys(), row)))
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    async def _process(self, lead: Dict[str, Any]) -> None:
+        self.matched += 1
+        for position, action in enumerate(self.request.actions):
+            try:
+                result = await execute_action(action, lead)
+            except Exception as e:
+                logger.warning("Workflow %s action %s failed for lead %s: %s", self.run_id, action.type, lead["id"], e)
+                result = {"status": "failed", "message": str(e)}
+
+            outcome = result["status"]
+            if outcome == "failed":
+                self.failed += 1
+            elif outcome == "skipped":
+                self.skipped += 1
+            elif action.type == "send_email":
+                self.emails_queued += 1
+            else:
+                # Counted once the flush knows whether the update applied.
+                self._status_changes[(position, action.new_status)].append((len(self._outbox), lead["id"]))
+                # Later actions of the same run (e.g. an email template) see the new status.
+                lead["status"] = action.new_status
+            if action.type != "update_status" or outcome != "done":
+                WORKFLOW_ACTIONS.inc(action=action.type, outcome=outcome)
+
+            self._outbox.append((
+                self.run_id, lead["id"], action.type, outcome,
+                result.get("recipient"), result.get("subject"), result.get("body"), result.get("message"),
+            ))
+
+    async def _flush(self) -> None:
+        async with self._flush_lock:
+            if not self._outbox:
+                return
+            status_changes, outbox = self._status_changes, self._outbox
+            self._status_changes, self._outbox = defaultdict(list), []
+            for outcome in await run_in_threadpool(_apply_batch, status_changes, outbox):
+                WORKFLOW_ACTIONS.inc(action="update_status", outcome=outcome)
+                if outcome == "done":
+                    self.status_updated += 1
+                else:
+                    self.skipped += 1
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            lead = await queue.get()
+            if lead is None:
+                return
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            await self._process(lead)
+            if len(self._outbox) >= self.batch_size:
+                await self._flush()
+
+    async def run(self) -> WorkflowRunResponse:
+        started = time.perf_counter()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.batch_size)
+        tasks = [asyncio.create_task(self._produce(queue))]
+        tasks += [asyncio.create_task(self._work(queue)) for _ in range(self.concurrency)]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            # On failure or cancellation nothing may be left to drain the
+            # bounded queue, so the tasks are cancelled rather than sent
+            # end-of-input markers they might never read.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._flush()
+
+        logger.info(
+            "Workflow run %s: %d leads, %d status updates, %d emails queued in %.2fs",
+            self.run_id, self.matched, self.status_updated, self.emails_queued, time.perf_counter() - started
+        )
+        return WorkflowRunResponse(
+            run_id=self.run_id,
+            matched=self.matched,
+            status_updated=self.status_updated,
+            emails_queued=self.emails_queued,
+            skipped=self.skipped,
+            failed=self.failed,
+            elapsed_seconds=round(time.perf_counter() - started, 3)
+        )
+
+async def run_workflow(request: WorkflowRunRequest) -> WorkflowRunResponse:
+    return await WorkflowRun(request).run()
+
+class LogEmailSender:
+    # Local stand-in for an SMTP server: messages are logged, not delivered.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def send(self, recipient: str, subject: str, body: str) -> None:
+        logger.info("Email to %s: %s", recipient, subject)
+
+class SMTPEmailSender:
+    # One connection per drain batch; point CRM_SMTP_HOST/PORT at a local
+    # debugging server (e.g. `python -m aiosmtpd -n`) during development.
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, sender: str = EMAIL_SENDER):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self._smtp: Optional[smtplib.SMTP] = None
+
+    def __enter__(self):
+        self._smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self._smtp.quit()
+        except smtplib.SMTPException:
+            self._smtp.close()
+        return False
+
+    def send(self, recipient: str, subject: str, body: str) -> None:
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = recipient
+        message["Subject"] = subject
+        message.set_content(body)
+        self._smtp.send_message(message)
+
+def get_email_sender():
+    if EMAIL_BACKEND == "smtp":
+        return SMTPEmailSender()
+    return LogEmailSender()
+
+@retry_on_busy
+def _claim_emails(owner: str, after_id: int, limit: int, lease_seconds: float = OUTBOX_LEASE_SECONDS):
+    with get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            conn.execute(
+                """UPDATE workflow_outbox SET status = 'pending', lease_owner = NULL, lease_expires_at = NULL
+                   WHERE status = 'sending' AND lease_expires_at < ?""",
+                (now,)
+            )
+            conn.execute(
+                """UPDATE workflow_outbox SET status = 'sending', lease_owner = ?, lease_expires_at = ?
+                   WHERE id IN (
+                       SELECT id FROM workflow_outbox WHERE status = 'pending' AND id > ? ORDER BY id LIMIT ?
+                   )""",
+                (owner, now + lease_seconds, after_id, limit)
+            )
+            rows = conn.execute(
+                """SELECT id, recipient, subject, body, attempts FROM workflow_outbox
+                   WHERE status = 'sending' AND lease_owner = ? ORDER BY id""",
+                (owner,)
+            ).fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return rows
+
+@retry_on_busy
+def _record_deliveries(owner: str, sent: List[int], failed: List[Tuple[str, str, int]]) -> None:
+    # Only rows still claimed by this drain are touched: if its lease ran out
+    # and another drain reclaimed them, that drain's result stands.
+    with get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """UPDATE workflow_outbox SET status = 'sent', attempts = attempts + 1,
+                       sent_at = CURRENT_TIMESTAMP, lease_owner = NULL, lease_expires_at = NULL
+                   WHERE id IN (SELECT value FROM json_each(?)) AND status = 'sending' AND lease_owner = ?""",
+                (json.dumps(sent), owner)
+            )
+            conn.executemany(
+                """UPDATE workflow_outbox SET status = ?, detail = ?, attempts = attempts + 1,
+                       lease_owner = NULL, lease_expires_at = NULL
+                   WHERE id = ? AND status = 'sending' AND lease_owner = ?""",
+                [(*failure, owner) for failure in failed]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+@retry_on_busy
+def _release_emails(owner: str) -> int:
+    with get_db_connection() as conn:
+        cursor = conn.execute(
+            """UPDATE workflow_outbox SET status = 'pending', lease_owner = NULL, lease_expires_at = NULL
+               WHERE status = 'sending' AND lease_owner = ?""",
+            (owner,)
+        )
+        conn.commit()
+        return cursor.rowcount
+
+def count_pending_emails() -> int:
+    with get_db_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM workflow_outbox WHERE status = 'pending'").fetchone()[0]
+
+def drain_outbox(limit: Optional[int] = None, sender=None) -> OutboxDrainResponse:
+    # Walks pending emails by id so a message that fails and stays pending
+    # for a retry is not picked up again within the same drain.
+    sender = sender or get_email_sender()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    sent_total = failed_total = 0
+    last_id = 0
+    while limit is None or sent_total + failed_total < limit:
+        batch_size = OUTBOX_DRAIN_BATCH if limit is None else min(OUTBOX_DRAIN_BATCH, limit - sent_total - failed_total)
+        rows = _claim_emails(owner, last_id, batch_size)
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        sent: List[int] = []
+        failed: List[Tuple[str, str, int]] = []
+        try:
+            with sender:
+                for row in rows:
+                    try:
+                        sender.send(row["recipient"], row["subject"], row["body"])
+                        sent.append(row["id"])
+                    except (smtplib.SMTPException, OSError) as e:
+                        final = row["attempts"] + 1 >= OUTBOX_MAX_ATTEMPTS
+                        failed.append(("failed" if final else "pending", str(e), row["id"]))
+        except BaseException:
+            # Record what went out and hand the rest of the batch back now
+            # rather than when its lease runs out.
+            _record_deliveries(owner, sent, failed)
+            _release_emails(owner)
+            raise
+        _record_deliveries(owner, sent, failed)
+        OUTBOX_DELIVERIES.inc(len(sent), outcome="sent")
+        OUTBOX_DELIVERIES.inc(len(failed), outcome="failed")
+        sent_total += len(sent)
+        failed_total += len(failed)
+
+    return OutboxDrainResponse(sent=sent_total, failed=failed_total, remaining=count_pending_emails())